@@ -1,12 +1,11 @@
 import streamlit as st
-import decoupler as dc
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from io import BytesIO
 import base64
-import os
-from .utils import parse_gene_input
+from .utils import parse_gene_input, load_msigdb, _compute, _trace, _table, _session
 
 
 plt.rcParams["font.family"] = "Arial"
@@ -14,14 +13,11 @@ plt.rcParams['svg.fonttype'] = 'none'
 
 
 @st.cache_data(ttl='1d')
-def perform_gsea(ranked_genes, gene_sets, threshold):   
+def perform_gsea(ranked_genes, collections, threshold):   
+    _trace.record_miss()
     # Perform GSEA
-    gsea_df = dc.get_gsea_df(
-        df=ranked_genes,
-        stat='stat',
-        net=gene_sets,
-        source='geneset',
-        target='genesymbol',
+    gsea_df = _compute.get_backend().run(
+        _compute.gsea_task, ranked_genes, collections
     ).sort_values('NES', ascending=False)
     # Apply threshold on FDR p-value
     gsea_df = gsea_df.query('`FDR p-value` < @threshold')
@@ -29,22 +25,6 @@ def perform_gsea(ranked_genes, gene_sets, threshold):
     return gsea_df
 
 
-@st.cache_data(ttl='1d')
-def load_msigdb():
-    if os.path.exists('data/msigdb.feather'):
-        _msigdb = pd.read_feather('data/msigdb.feather')
-    else:
-        _msigdb = dc.get_resource('MSigDB')
-        if not os.path.exists('data'):
-            os.makedirs('data')
-            _msigdb.to_feather('data/msigdb.feather')
-    
-    _msigdb = _msigdb[~_msigdb.duplicated(['geneset', 'genesymbol'])]
-    unique_collections = _msigdb['collection'].unique()
-
-    return _msigdb, unique_collections
-
-
 def get_user_inputs(unique_collections):
     all_option = "Select All"
     options = [all_option] + list(unique_collections)
@@ -85,36 +65,38 @@ def get_user_inputs(unique_collections):
 
 def plot_results(enr, top_n, bar_color):
     top_results = enr.head(top_n).sort_values('NES', ascending=True)
-    plt.figure(figsize=(10, 0.6 * len(top_results)))
-    plt.barh(top_results['Term'], top_results['NES'], color=bar_color)
-    plt.xlabel('Normalized Enrichment Score (NES)', fontsize=12)
-    plt.ylabel('Term', fontsize=12)
-    plt.title(f'Top {top_n} Enriched Gene Sets')
-    ax = plt.gca()
+    fig = Figure(figsize=(10, 0.6 * len(top_results)))
+    ax = fig.subplots()
+    ax.barh(top_results['Term'], top_results['NES'], color=bar_color)
+    ax.set_xlabel('Normalized Enrichment Score (NES)', fontsize=12)
+    ax.set_ylabel('Term', fontsize=12)
+    ax.set_title(f'Top {top_n} Enriched Gene Sets')
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    plt.tight_layout()
+    fig.tight_layout()
     buf = BytesIO()
-    plt.savefig(buf, format='png', dpi=300)
+    fig.savefig(buf, format='png', dpi=300)
     buf.seek(0)
     image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close()
     st.image(f'data:image/png;base64,{image_base64}')
 
 
 def main():
-    _msigdb, unique_collections = load_msigdb()
+    with _trace.stage('load_msigdb', cached=True):
+        _msigdb, unique_collections = load_msigdb()
     selected_collections, ranked_genes, pvalue_threshold, top_n, bar_color, perform_gsea_button = get_user_inputs(unique_collections)
-    if perform_gsea_button:
+    # The plot settings only redraw the plot
+    if _session.submitted('gsea_submitted', (ranked_genes, selected_collections, pvalue_threshold),
+                          perform_gsea_button):
         if selected_collections:
-            gene_sets = _msigdb[_msigdb['collection'].isin(selected_collections)]
-            enr = perform_gsea(ranked_genes, gene_sets, pvalue_threshold)
+            with _trace.stage('perform_gsea', cached=True, n_genes=len(ranked_genes), n_collections=len(selected_collections)):
+                enr = perform_gsea(ranked_genes, selected_collections, pvalue_threshold)
             if not enr.empty:
                 st.subheader('GSEA Results')
                 tab1, tab2 = st.tabs(["View as Table", "Plot Results"])
                 with tab1:
-                    st.dataframe(enr)
-                with tab2:
+                    _table.paginated_dataframe(enr, key='gsea_results', file_name='gsea_results')
+                with tab2, _trace.stage('plot_results', n_terms=min(top_n, len(enr))):
                     plot_results(enr, top_n, bar_color)
             else:
                 st.warning('No significant results found.')
@@ -0,0 +1,164 @@
+import streamlit as st
+import os
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+from .utils import load_msigdb, _compute, _trace, _table, _session
+from .ora_adata import load_adata, compute_rank_genes
+
+
+RANK_STATS = {
+    'Score': 'scores',
+    'Log fold change': 'logfoldchanges',
+}
+
+
+@st.cache_data(ttl=86400)  # Cache data for one day
+def get_group_stats(_adata, groupby, layer, stat, adata_path=None):
+    '''Return a groups x genes matrix of a rank_genes_groups statistic.
+
+    Every gene tested for a group keeps its statistic, so each row is a
+    complete ranked list rather than the top-N genes used by ORA.
+
+    Returns None if rank_genes_groups did not store `stat`.
+    '''
+    _trace.record_miss()
+    compute_rank_genes(_adata, groupby, 'rank_genes_groups', layer, adata_path=adata_path, require_all_genes=True)
+    result = _adata.uns['rank_genes_groups']
+    if stat not in result:
+        return None
+    mat = pd.DataFrame({
+        group: pd.Series(np.asarray(result[stat][group], dtype=float), index=result['names'][group])
+        for group in result['names'].dtype.names
+    }).T
+    return mat.replace([np.inf, -np.inf], np.nan).fillna(0.0)
+
+
+@st.cache_data(ttl=86400)  # Cache data for one day
+def run_gsea(mat, collections, times=1000):
+    '''Run GSEA for all groups, split across the compute pool, and cache the result.'''
+    from scipy.stats import false_discovery_control
+
+    _trace.record_miss()
+    backend = _compute.get_backend()
+    n_chunks = max(1, min(backend.n_workers, mat.shape[0]))
+    chunks = [
+        (mat.iloc[rows], collections, times)
+        for rows in np.array_split(np.arange(mat.shape[0]), n_chunks)]
+    results = backend.starmap(_compute.gsea_matrix_task, chunks)
+    es, nes, pvals = (pd.concat([res[i] for res in results]) for i in range(3))
+    pvals = pvals.fillna(1.0)
+    # Benjamini-Hochberg within each group, as get_gsea_df does for one list
+    fdr = pd.DataFrame(
+        false_discovery_control(pvals.to_numpy(), axis=1),
+        index=pvals.index, columns=pvals.columns)
+
+    enrich_res = pd.concat({
+        'ES': es.stack(), 'NES': nes.stack(),
+        'NOM p-value': pvals.stack(), 'FDR p-value': fdr.stack(),
+    }, axis=1).rename_axis(['group', 'Term']).reset_index()
+    return nes, enrich_res
+
+
+def plot_results(enrich_res, threshold, top_n_terms):
+    '''Plot the top terms of every group using DotClustermapPlotter.'''
+    from PyComplexHeatmap import DotClustermapPlotter
+
+    significant = enrich_res[enrich_res['FDR p-value'] < threshold]
+    top_terms = (
+        significant.assign(abs_nes=significant['NES'].abs())
+        .sort_values('abs_nes', ascending=False)
+        .groupby('group').head(top_n_terms)['Term'].unique())
+    if len(top_terms) == 0:
+        st.warning('No significant results found.')
+        return
+
+    plot_df = enrich_res[enrich_res['Term'].isin(top_terms)].copy()
+    # Keep the dot size finite for p-values of zero
+    plot_df['-log10(FDR p-value)'] = -np.log10(plot_df['FDR p-value'].clip(lower=1e-10))
+    plot_df['Term'] = plot_df['Term'].apply(lambda x: ' '.join(x.split('_')[1:]))
+
+    with _trace.stage('plot_results', n_terms=len(top_terms)):
+        fig, ax = plt.subplots()
+        dm = DotClustermapPlotter(
+            data=plot_df,
+            x='group', y='Term',
+            value='NES', c='NES', s='-log10(FDR p-value)',
+            row_cluster=True,
+            col_cluster=False,
+            cmap='RdBu_r',
+            show_rownames=True,
+            show_colnames=True,
+            row_names_side='left',
+            yticklabels_kws={'labelsize': 8},
+            verbose=0,
+        )
+        st.pyplot(fig)
+
+
+def main():
+    '''Main function to run GSEA for every group of an AnnData and display results.'''
+    with _trace.stage('load_msigdb', cached=True):
+        _msigdb, unique_genesets = load_msigdb()
+    all_option = "Select All"
+    options = [all_option] + list(unique_genesets)
+    default_collections = ['hallmark', 'kegg_pathways']
+    selected_collections = st.multiselect('Select Gene Sets', options, default=default_collections)
+    if all_option in selected_collections:
+        selected_collections = list(unique_genesets)
+
+    adata_path = st.text_area('Input the path of AnnData file:', height=68)
+
+    if os.path.exists(adata_path) and adata_path.endswith('.h5ad'):
+        with _trace.stage('load_adata', cached=True):
+            adata = load_adata(adata_path)
+        st.info(str(adata).split('\n')[0])
+
+        layer_keys = [None] + list(adata.layers.keys())
+        layer_key = st.selectbox('Select a layer (optional):', layer_keys)
+        if layer_key:
+            adata.X = adata.layers[layer_key]
+
+        obs_columns = adata.obs.columns
+        group_label = st.selectbox('Select a group label:', obs_columns, index=None)
+
+        stat_label = st.selectbox('Rank genes by:', list(RANK_STATS))
+        times = st.number_input('Number of permutations:', min_value=100, max_value=10000, value=1000, step=100)
+        pvalue_threshold = st.slider('Set FDR p-value threshold', min_value=0.0, max_value=0.250, value=0.050, step=0.001)
+        top_n_terms = st.number_input('Number of top terms per group to display:', min_value=1, max_value=50, value=5)
+
+        run_buttom = st.button('Run GSEA', use_container_width=False)
+
+        # The threshold and number of terms only filter the plot
+        inputs = (adata_path, layer_key, group_label, selected_collections, stat_label, times)
+        if group_label and selected_collections and _session.submitted('gsea_adata_submitted', inputs, run_buttom):
+            with st.spinner('Getting ranked genes of every group...'), \
+                    _trace.stage('get_group_stats', cached=True, n_obs=adata.n_obs, n_vars=adata.n_vars):
+                mat = get_group_stats(
+                    adata,
+                    groupby=group_label,
+                    layer=layer_key,
+                    stat=RANK_STATS[stat_label],
+                    adata_path=adata_path)
+            if mat is None:
+                st.error(f'`{RANK_STATS[stat_label]}` is not stored in rank_genes_groups.', icon="🚨")
+                return
+
+            with st.spinner(f'Running GSEA for {mat.shape[0]} groups...'), \
+                    _trace.stage('run_gsea', cached=True, n_groups=mat.shape[0], n_genes=mat.shape[1],
+                                 n_collections=len(selected_collections)):
+                nes, enrich_res = run_gsea(mat, selected_collections, times=times)
+
+            st.subheader('GSEA Results')
+            tab1, tab2, tab3 = st.tabs(["NES Matrix", "View as Table", "Plot Results"])
+            with tab1:
+                nes_matrix = nes.T.rename_axis('Term').reset_index()
+                _table.paginated_dataframe(nes_matrix, key='gsea_adata_nes', file_name='gsea_nes_matrix')
+            with tab2:
+                _table.paginated_dataframe(
+                    enrich_res.sort_values('FDR p-value'), key='gsea_adata_results', file_name='gsea_results')
+            with tab3:
+                plot_results(enrich_res, pvalue_threshold, top_n_terms)
+
+    else:
+        st.warning('Please input a valid path to an AnnData file.')
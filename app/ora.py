@@ -1,45 +1,25 @@
 import streamlit as st
-import decoupler as dc
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from io import BytesIO
 import base64
-import os
-from .utils import parse_gene_input
+from .utils import parse_gene_input, load_msigdb, _compute, _trace, _table
 
 plt.rcParams["font.family"] = "Arial"
 plt.rcParams['svg.fonttype'] = 'none'
 
 
 @st.cache_data(ttl='1d')
-def perform_ora(genes, gene_sets, threshold):
-    enr_pvals = dc.get_ora_df(
-        df=genes,
-        net=gene_sets,
-        source='geneset',
-        target='genesymbol'
+def perform_ora(genes, collections, threshold):
+    _trace.record_miss()
+    enr_pvals = _compute.get_backend().run(
+        _compute.ora_task, genes, collections
     ).sort_values('FDR p-value', ascending=True)
     enr_pvals = enr_pvals.query('`FDR p-value` < @threshold')
     return enr_pvals
 
 
-@st.cache_data(ttl='1d')
-def load_msigdb():
-    if os.path.exists('data/msigdb.feather'):
-        _msigdb = pd.read_feather('data/msigdb.feather')
-    else:
-        _msigdb = dc.get_resource('MSigDB')
-        if not os.path.exists('data'):
-            os.makedirs('data')
-            _msigdb.to_feather('data/msigdb.feather')
-    
-    _msigdb = _msigdb[~_msigdb.duplicated(['geneset', 'genesymbol'])]
-    unique_genesets = _msigdb['collection'].unique()
-
-    return _msigdb, unique_genesets
-
-
 def get_user_inputs(unique_genesets):
     all_option = "Select All"
     options = [all_option] + list(unique_genesets)
@@ -66,40 +46,42 @@ def get_user_inputs(unique_genesets):
 
 def plot_results(enr_pvals, top_n, bar_color):
     top_results = enr_pvals.head(top_n).sort_values('FDR p-value', ascending=False)
-    plt.figure(figsize=(10, 0.6 * len(top_results)))
-    plt.barh(top_results['Term'], -np.log10(top_results['FDR p-value']), color=bar_color)
-    plt.xlabel('-log10(FDR p-value)', fontsize=12)
-    plt.ylabel('Term', fontsize=12)
-    plt.title(f'Top {top_n} Enriched Gene Sets')
-    ax = plt.gca()
+    # A Figure of its own rather than pyplot's current figure, which the
+    # threads of concurrent sessions would share
+    fig = Figure(figsize=(10, 0.6 * len(top_results)))
+    ax = fig.subplots()
+    ax.barh(top_results['Term'], -np.log10(top_results['FDR p-value']), color=bar_color)
+    ax.set_xlabel('-log10(FDR p-value)', fontsize=12)
+    ax.set_ylabel('Term', fontsize=12)
+    ax.set_title(f'Top {top_n} Enriched Gene Sets')
     for text in ax.get_yticklabels():
-        plt.text(text.get_position()[0], text.get_position()[1], text.get_text(), ha='left', va='center')
+        ax.text(text.get_position()[0], text.get_position()[1], text.get_text(), ha='left', va='center')
     ax.set_yticks([])
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
-    plt.tight_layout()
+    fig.tight_layout()
     buf = BytesIO()
-    plt.savefig(buf, format='png', dpi=300)
+    fig.savefig(buf, format='png', dpi=300)
     buf.seek(0)
     image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close()
     st.image(f'data:image/png;base64,{image_base64}')
 
 
 def main():
     # setup_ui()
-    _msigdb, unique_genesets = load_msigdb()
+    with _trace.stage('load_msigdb', cached=True):
+        _msigdb, unique_genesets = load_msigdb()
     selected_collections, user_genes, pvalue_threshold, top_n, bar_color, perform_ora_button = get_user_inputs(unique_genesets)
     if perform_ora_button or bar_color:
         if user_genes and selected_collections:
-            gene_sets = _msigdb[_msigdb['collection'].isin(selected_collections)]
-            enr_pvals = perform_ora(user_genes, gene_sets, pvalue_threshold)
+            with _trace.stage('perform_ora', cached=True, n_genes=len(user_genes), n_collections=len(selected_collections)):
+                enr_pvals = perform_ora(user_genes, selected_collections, pvalue_threshold)
             if not enr_pvals.empty:
                 st.subheader('ORA Results')
                 tab1, tab2 = st.tabs(["View as Table", "Plot Results"])
                 with tab1:
-                    st.dataframe(enr_pvals)
-                with tab2:
+                    _table.paginated_dataframe(enr_pvals, key='ora_results', file_name='ora_results')
+                with tab2, _trace.stage('plot_results', n_terms=min(top_n, len(enr_pvals))):
                     plot_results(enr_pvals, top_n, bar_color)
             else:
                 st.warning('No significant results found.')
@@ -1,17 +1,17 @@
 import streamlit as st
 import os
-import scanpy as sc
 import pandas as pd
 import numpy as np
-import decoupler as dc
 import matplotlib.pyplot as plt
-from .utils import load_msigdb
-from PyComplexHeatmap import DotClustermapPlotter
+from .utils import load_msigdb, _compute, _trace, _table, _session
 
 
 @st.cache_data(ttl=86400)  # Cache data for one day (in seconds)
 def load_adata(adata_path):
     '''Load an AnnData object from the specified path.'''
+    _trace.record_miss()
+    import scanpy as sc
+
     adata = sc.read_h5ad(adata_path)
     return adata
 
@@ -40,6 +40,8 @@ def get_rank_genes_from_groups(
     return_rank_genes : bool
         Whether to return the ranked genes.
     '''
+    import scanpy as sc
+
     rank_genes = {}
     for group in _adata.obs[groupby].cat.categories:
         group_data = sc.get.rank_genes_groups_df(_adata, group=group, key=key).dropna()['names'].values
@@ -51,16 +53,58 @@ def get_rank_genes_from_groups(
         return rank_genes
     
 
+def compute_rank_genes(_adata, groupby, key, layer, adata_path=None, require_all_genes=False):
+    '''Run rank_genes_groups on `_adata` unless `key` already holds a matching result.
+
+    Both the unfiltered ``rank_genes_groups`` and the filtered
+    ``rank_genes_groups_filtered`` results are stored in `_adata.uns`.
+    As with ``sc.tl.rank_genes_groups(layer=None)``, `_adata.raw` is tested
+    when no layer is selected and it is present.
+
+    A stored result is reused only if it was computed for the same
+    `groupby`, layer and use of raw. With `require_all_genes`, it must also
+    rank every tested gene; a result stored in the file may have been
+    computed with an explicit ``n_genes``.
+
+    The matrix is kept in the compute pool's shared memory under
+    `adata_path`, so it must be the file `_adata` was loaded from, or None.
+    '''
+    # Like scanpy, test adata.raw when no layer is selected and raw is present
+    use_raw = layer is None and _adata.raw is not None
+    if use_raw:
+        X, var_names = _adata.raw.X, _adata.raw.var_names
+    else:
+        X = _adata.layers[layer] if layer else _adata.X
+        var_names = _adata.var_names
+
+    # Check if rank_genes_groups is already computed
+    if key in _adata.uns:
+        params = _adata.uns[key]['params']
+        if (params['groupby'] == groupby
+                and params.get('layer') == layer
+                and bool(params.get('use_raw')) == use_raw
+                and (not require_all_genes or len(_adata.uns[key]['names']) == len(var_names))):
+            # Skip recomputation if parameters match
+            return
+
+    # Run the DE test in the compute pool. Without a file path nothing tells
+    # AnnData objects apart, so their matrices are not shared.
+    matrix_key = None if adata_path is None else (adata_path, 'raw' if use_raw else layer)
+    rank_genes, rank_genes_filtered = _compute.get_backend().run_on_matrix(
+        matrix_key, X,
+        _compute.rank_genes_task, _adata.obs[[groupby]], var_names, groupby)
+    # The worker tests a plain matrix; record the source it actually came from
+    for result in (rank_genes, rank_genes_filtered):
+        result['params'] = {**result['params'], 'use_raw': use_raw, 'layer': layer}
+    _adata.uns['rank_genes_groups'] = rank_genes
+    _adata.uns['rank_genes_groups_filtered'] = rank_genes_filtered
+
+
 @st.cache_data(ttl=86400)  # Cache data for one day
-def get_rank_genes(_adata, groupby, key, layer, n_genes=None):
+def get_rank_genes(_adata, groupby, key, layer, n_genes=None, adata_path=None):
     '''Compute and return ranked genes as a DataFrame.'''
-    # Check if rank_genes_groups is already computed
-    if key in _adata.uns and _adata.uns[key]['params']['groupby'] == groupby:
-        # Skip recomputation if parameters match
-        pass
-    else:
-        sc.tl.rank_genes_groups(_adata, groupby=groupby, method="wilcoxon", layer=layer)
-        sc.tl.filter_rank_genes_groups(_adata)
+    _trace.record_miss()
+    compute_rank_genes(_adata, groupby, key, layer, adata_path=adata_path)
     rank_genes = get_rank_genes_from_groups(
         _adata, groupby=groupby, key=key, n_genes=n_genes,
         print_rank_genes=False, return_rank_genes=True)
@@ -71,20 +115,16 @@ def get_rank_genes(_adata, groupby, key, layer, n_genes=None):
 @st.cache_data(ttl=86400)  # Cache data for one day
 def run_ora(
         gene_df: pd.DataFrame, 
-        gene_sets: pd.DataFrame, 
-        source: str ='geneset', 
-        target: str ='genesymbol',
+        collections: list, 
         n_top: int = None):
-    '''Run ORA analysis and cache the result.'''
+    '''Run ORA analysis for every column in parallel and cache the result.'''
+    _trace.record_miss()
+    gene_lists = [(list(set(gene_df[col].dropna())), collections) for col in gene_df.columns]
+    results = _compute.get_backend().starmap(_compute.ora_task, gene_lists)
+
     enrich_res = []
-    for col in gene_df.columns:
-        genes = list(set(gene_df[col]))
-        enr_pvals = dc.get_ora_df(
-                    df=genes,
-                    net=gene_sets,
-                    source=source,
-                    target=target
-                ).sort_values('FDR p-value', ascending=True)
+    for col, enr_pvals in zip(gene_df.columns, results):
+        enr_pvals = enr_pvals.sort_values('FDR p-value', ascending=True)
         
         if n_top is not None:
             enr_pvals = enr_pvals.head(n_top)
@@ -96,9 +136,12 @@ def run_ora(
     return enrich_res
 
 
-def plot_results(rank_genes, gene_sets, top_n_terms):
+def plot_results(rank_genes, collections, top_n_terms):
     '''Plot ORA results using DotClustermapPlotter.'''
-    enrich_res = run_ora(rank_genes, gene_sets, n_top=top_n_terms)
+    from PyComplexHeatmap import DotClustermapPlotter
+
+    with _trace.stage('run_ora', cached=True, n_groups=rank_genes.shape[1], n_collections=len(collections)):
+        enrich_res = run_ora(rank_genes, collections, n_top=top_n_terms)
     enrich_res = enrich_res[enrich_res['FDR p-value'] < 0.05]
     # Calculate additional columns for plotting
     enrich_res['-log10(FDR p-value)'] = -np.log10(enrich_res['FDR p-value'])
@@ -107,34 +150,28 @@ def plot_results(rank_genes, gene_sets, top_n_terms):
     enrich_res['Term'] = enrich_res['Term'].apply(lambda x: ' '.join(x.split('_')[1:]))
 
     # Plot using DotClustermapPlotter
-    fig, ax = plt.subplots()
-    dm = DotClustermapPlotter(
-        data=enrich_res, 
-        x='cell_module', y='Term',
-        value='log10(Odds ratio)', c='log10(Odds ratio)', s='-log10(FDR p-value)',
-        row_cluster=True,
-        col_cluster=False,
-        cmap='Blues',
-        show_rownames=True,
-        show_colnames=True,
-        row_names_side='left',
-        yticklabels_kws={'labelsize': 8},
-        verbose=0,
-        legend_gap=15,
-    )
-    st.pyplot(fig)
-
-
-@st.cache_data(ttl=86400)  # Cache data for one day
-def cached_load_msigdb():
-    '''Load MSigDB gene sets and cache the result.'''
-    return load_msigdb()
+    with _trace.stage('plot_results', n_terms=enrich_res['Term'].nunique()):
+        fig, ax = plt.subplots()
+        dm = DotClustermapPlotter(
+            data=enrich_res, 
+            x='cell_module', y='Term',
+            value='log10(Odds ratio)', c='log10(Odds ratio)', s='-log10(FDR p-value)',
+            row_cluster=True,
+            col_cluster=False,
+            cmap='Blues',
+            show_rownames=True,
+            show_colnames=True,
+            row_names_side='left',
+            yticklabels_kws={'labelsize': 8},
+            verbose=0,
+        )
+        st.pyplot(fig)
 
 
 def main():
     '''Main function to run the ORA analysis and display results.'''
-    # Use cached load_msigdb
-    _msigdb, unique_genesets = cached_load_msigdb()
+    with _trace.stage('load_msigdb', cached=True):
+        _msigdb, unique_genesets = load_msigdb()
     all_option = "Select All"
     options = [all_option] + list(unique_genesets)
     default_collections = ['hallmark', 'kegg_pathways']
@@ -142,12 +179,11 @@ def main():
     if all_option in selected_collections:
         selected_collections = list(unique_genesets)
 
-    gene_sets = _msigdb[_msigdb['collection'].isin(selected_collections)]
-    
     adata_path = st.text_area('Input the path of AnnData file:', height=68)
 
     if os.path.exists(adata_path) and adata_path.endswith('.h5ad'):
-        adata = load_adata(adata_path)
+        with _trace.stage('load_adata', cached=True):
+            adata = load_adata(adata_path)
         st.info(str(adata).split('\n')[0])
 
         layer_keys = [None] + list(adata.layers.keys())
@@ -164,22 +200,25 @@ def main():
         run_buttom = st.button('Run ORA', use_container_width=False)
         
 
-        if group_label and run_buttom:
+        inputs = (adata_path, layer_key, group_label, selected_collections, top_n_genes, top_n_terms)
+        if group_label and _session.submitted('ora_adata_submitted', inputs, run_buttom):
             st.subheader('Cell type specific genes')
-            with st.spinner('Getting cell type specific genes...'):
+            with st.spinner('Getting cell type specific genes...'), \
+                    _trace.stage('get_rank_genes', cached=True, n_obs=adata.n_obs, n_vars=adata.n_vars):
                 rank_genes_df = get_rank_genes(
                     adata, 
                     groupby=group_label, 
                     key='rank_genes_groups_filtered', 
                     layer=layer_key, 
-                    n_genes=top_n_genes)
+                    n_genes=top_n_genes,
+                    adata_path=adata_path)
             
             tab1, tab2 = st.tabs(["View as Table", "Plot Results"])
             with tab1:
-                st.dataframe(rank_genes_df)
+                _table.paginated_dataframe(rank_genes_df, key='rank_genes', file_name='rank_genes')
             with tab2:
                 placeholder = st.info('Running ORA...')
-                plot_results(rank_genes_df, gene_sets, top_n_terms)
+                plot_results(rank_genes_df, selected_collections, top_n_terms)
                 placeholder.empty()
 
 
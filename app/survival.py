@@ -1,7 +1,8 @@
-from .utils import _survival
+from .utils import _survival, _trace
 import streamlit as st
 from io import BytesIO
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import base64
 import yaml
 
@@ -14,6 +15,7 @@ SURVIVAL_METRICS = ['OS', 'DSS', 'PFI']
 
 @st.cache_data(ttl='1d')
 def load_survival_data(data, survival_data):
+    _trace.record_miss()
     exp_data = data[survival_data]['exp']
     meta_data = data[survival_data]['meta']
     ad_tcga = _survival.Survival(exp_data, meta_data, meta_index_col='sample')
@@ -32,7 +34,8 @@ def main():
         index=None
         )
     if survival_data is not None:
-        ad_tcga = load_survival_data(data, survival_data)
+        with _trace.stage('load_survival_data', cached=True, cohort=survival_data):
+            ad_tcga = load_survival_data(data, survival_data)
 
         user_genes = st.text_area('Enter Genes (separated by spaces)', height=200)
 
@@ -66,27 +69,30 @@ def main():
         genes = user_genes.split()
         genes = [gene.strip() for gene in genes]
 
-        ad_tcga.group_meta(
-            groupby=genes, 
-            group_method='median', 
-            event='event', 
-            time='time',
-            time_limit=max_time,
-        )
+        with _trace.stage('group_meta', n_genes=len(genes), n_samples=ad_tcga.n_obs):
+            ad_tcga.group_meta(
+                groupby=genes, 
+                group_method='median', 
+                event='event', 
+                time='time',
+                time_limit=max_time,
+            )
 
         # Plot survival curves
         st.subheader('Survival Plots')
-        buf = BytesIO()
-        fig, ax = plt.subplots(figsize=(4, 4))
-        ad_tcga.km_plot(
-            ax=ax, 
-            xlabel=axis_units,
-            ylabel=survival_metrics,
-            ci_show=ci_show
-            )
-        plt.tight_layout()
-        plt.savefig(buf, format='png', dpi=150)
-        buf.seek(0)
+        with _trace.stage('km_plot', n_samples=len(ad_tcga.uns['survival'])):
+            buf = BytesIO()
+            fig = Figure(figsize=(4, 4))
+            ax = fig.subplots()
+            ad_tcga.km_plot(
+                ax=ax, 
+                xlabel=axis_units,
+                ylabel=survival_metrics,
+                ci_show=ci_show
+                )
+            fig.tight_layout()
+            fig.savefig(buf, format='png', dpi=150)
+            buf.seek(0)
         image_base64 = base64.b64encode(buf.read()).decode('utf-8')
         st.markdown(
             f'<div style="display: flex; justify-content: center;">'
@@ -1,3 +1,11 @@
-from . import _survival
-from ._io import * 
-from ._gene_enrich import *
\ No newline at end of file
+# Submodules are imported on first use (`from app.utils import _compute`), so
+# importing the package for `_startup` and `_trace` in webui.py does not pull
+# in anndata, matplotlib or pyarrow; the warm-up thread imports them.
+from ._io import *
+
+
+def __getattr__(name):
+    if name == 'load_msigdb':
+        from ._gene_enrich import load_msigdb
+        return load_msigdb
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,453 @@
+import atexit
+import importlib
+import os
+import shutil
+import sys
+import threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import streamlit as st
+from . import _trace
+
+
+# Number of worker processes; 0 runs every task inline in the Streamlit process.
+N_WORKERS = int(os.environ.get('BIO_WEBUI_COMPUTE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Collection combinations whose gene sets each process keeps built.
+NETWORK_CACHE_SIZE = int(os.environ.get('BIO_WEBUI_NETWORK_CACHE_SIZE', 8))
+
+# Upper bound for expression matrices kept in shared memory; defaults to half
+# of the space free in /dev/shm when the backend starts.
+SHM_BUDGET_MB = os.environ.get('BIO_WEBUI_SHM_BUDGET_MB')
+
+SHM_DIR = '/dev/shm'
+
+# Imported by every worker on startup so the first tasks do not pay for them.
+WORKER_MODULES = ['decoupler', 'scanpy']
+
+# Per-process state: the shared MSigDB network.
+_network = None
+_network_handles = []
+
+
+def _publish_array(arr):
+    '''Copy a numpy array into a new shared memory block.'''
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    spec = {'name': shm.name, 'shape': arr.shape, 'dtype': arr.dtype.str}
+    return spec, shm
+
+
+def _attach_array(spec, handles):
+    '''Return a read-only view on a shared memory block without copying.'''
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=spec['name'], track=False)
+    else:
+        # Spawned workers share the publisher's resource tracker, so attaching
+        # only repeats the publisher's registration. Unregistering here would
+        # drop it and leak the block if the server is killed.
+        shm = shared_memory.SharedMemory(name=spec['name'])
+    handles.append(shm)
+    arr = np.ndarray(spec['shape'], dtype=np.dtype(spec['dtype']), buffer=shm.buf)
+    arr.flags.writeable = False
+    return arr
+
+
+def publish_frame(df):
+    '''Publish a DataFrame into shared memory.
+
+    String columns are stored as categorical codes; the categories travel
+    with the returned spec, which is small enough to pickle.
+
+    Returns
+    -------
+    spec : dict
+        Description used by :func:`attach_frame`.
+    handles : list
+        SharedMemory blocks that must stay alive while the spec is in use.
+    '''
+    columns, handles = [], []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            arr_spec, shm = _publish_array(values.to_numpy())
+            columns.append((col, arr_spec, None))
+        else:
+            cat = pd.Categorical(values)
+            arr_spec, shm = _publish_array(cat.codes)
+            columns.append((col, arr_spec, list(cat.categories)))
+        handles.append(shm)
+    return {'columns': columns, 'length': len(df)}, handles
+
+
+def attach_frame(spec, handles):
+    '''Rebuild a DataFrame on top of the shared memory described by `spec`.'''
+    data = {}
+    for col, arr_spec, categories in spec['columns']:
+        arr = _attach_array(arr_spec, handles)
+        if categories is None:
+            data[col] = arr
+        else:
+            data[col] = pd.Categorical.from_codes(arr, categories=categories)
+    return pd.DataFrame(data, copy=False)
+
+
+def publish_matrix(X):
+    '''Publish a dense or CSR/CSC matrix into shared memory.'''
+    from scipy import sparse
+
+    if sparse.issparse(X):
+        X = X.tocsr() if X.format not in ('csr', 'csc') else X
+        parts = {'data': X.data, 'indices': X.indices, 'indptr': X.indptr}
+        spec = {'format': X.format, 'shape': X.shape, 'parts': {}}
+    else:
+        parts = {'data': np.asarray(X)}
+        spec = {'format': 'dense', 'shape': X.shape, 'parts': {}}
+    handles = []
+    for key, arr in parts.items():
+        spec['parts'][key], shm = _publish_array(arr)
+        handles.append(shm)
+    return spec, handles
+
+
+def attach_matrix(spec, handles):
+    '''Rebuild a matrix published by :func:`publish_matrix` without copying.'''
+    from scipy import sparse
+
+    parts = {key: _attach_array(arr_spec, handles) for key, arr_spec in spec['parts'].items()}
+    if spec['format'] == 'dense':
+        return parts['data']
+    matrix_cls = sparse.csr_matrix if spec['format'] == 'csr' else sparse.csc_matrix
+    return matrix_cls((parts['data'], parts['indices'], parts['indptr']), shape=spec['shape'], copy=False)
+
+
+def _set_network(network):
+    global _network
+    _network = network
+    _network_subset.cache_clear()
+
+
+def _init_worker(network_spec):
+    '''Attach a pool worker to the shared MSigDB network and import the task libraries.'''
+    _set_network(attach_frame(network_spec, _network_handles))
+    for module in WORKER_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            # Only the tasks that need it will fail
+            pass
+
+
+def _noop():
+    pass
+
+
+@lru_cache(maxsize=NETWORK_CACHE_SIZE)
+def _network_subset(collections):
+    # Select rows on the categorical codes; the subset keeps the categorical
+    # columns, so only its int codes are copied, never the gene symbols.
+    collection = _network['collection'].cat
+    codes = [collection.categories.get_loc(c) for c in collections if c in collection.categories]
+    mask = np.isin(collection.codes.to_numpy(), codes)
+    return _network.loc[mask, ['geneset', 'genesymbol']]
+
+
+def _get_network(collections):
+    '''Return the gene sets of the given collections, keeping the latest few built.'''
+    return _network_subset(tuple(sorted(collections)))
+
+
+def ora_task(genes, collections):
+    '''Run ORA of `genes` against the selected MSigDB collections.'''
+    import decoupler as dc
+
+    return dc.get_ora_df(
+        df=list(genes),
+        net=_get_network(collections),
+        source='geneset',
+        target='genesymbol',
+    )
+
+
+def gsea_task(ranked_genes, collections):
+    '''Run GSEA of a ranked gene table against the selected MSigDB collections.'''
+    import decoupler as dc
+
+    return dc.get_gsea_df(
+        df=ranked_genes,
+        stat='stat',
+        net=_get_network(collections),
+        source='geneset',
+        target='genesymbol',
+    )
+
+
+def gsea_matrix_task(mat, collections, times=1000, seed=42):
+    '''Run GSEA for every row of a groups x genes statistics matrix at once.
+
+    Returns
+    -------
+    es, nes, pvals : pd.DataFrame
+        Groups x terms enrichment scores, normalized enrichment scores and
+        empirical p-values.
+    '''
+    import decoupler as dc
+
+    es, nes, pvals = dc.run_gsea(
+        mat=mat,
+        net=_get_network(collections),
+        source='geneset',
+        target='genesymbol',
+        times=times,
+        seed=seed,
+        verbose=False,
+    )
+    # The terms come back as a categorical of every gene set in the shared
+    # network; keep only the plain names of the ones tested.
+    for df in (es, nes, pvals):
+        df.columns = df.columns.astype(str)
+    return es, nes, pvals
+
+
+def rank_genes_task(matrix, obs, var_names, groupby, method='wilcoxon'):
+    '''Run rank_genes_groups on an expression matrix.
+
+    `matrix` is a spec from :func:`publish_matrix` for a shared dense
+    matrix, or the matrix itself (sparse, or not shared). `var_names` must
+    describe its columns, i.e. the ``raw`` gene set for ``adata.raw.X``.
+    As in scanpy's default, every gene is ranked, so the result also serves
+    the full ranked lists GSEA needs.
+
+    Returns the unfiltered and filtered `uns` entries so the caller can
+    store them on its own AnnData.
+    '''
+    import anndata as ad
+    import scanpy as sc
+
+    handles = []
+    X = attach_matrix(matrix, handles) if isinstance(matrix, dict) else matrix
+    adata = ad.AnnData(X=X, obs=obs, var=pd.DataFrame(index=var_names))
+    sc.tl.rank_genes_groups(adata, groupby=groupby, method=method)
+    sc.tl.filter_rank_genes_groups(adata)
+    result = adata.uns['rank_genes_groups'], adata.uns['rank_genes_groups_filtered']
+    # Drop the views before their shared memory handles go out of scope.
+    del adata, X
+    return result
+
+
+def _shm_free_bytes():
+    try:
+        return shutil.disk_usage(SHM_DIR).free
+    except OSError:
+        return 0
+
+
+def _measured(fn, *args, **kwargs):
+    '''Run a task in a worker and return its result with the worker's RSS usage.'''
+    with _trace.measure_rss(include_children=False) as usage:
+        result = fn(*args, **kwargs)
+    return result, usage
+
+
+class ComputeBackend:
+    '''Process pool sharing MSigDB and loaded expression matrices.
+
+    The MSigDB network is published into shared memory once and every
+    worker attaches to it on startup, so tasks only ship their small
+    inputs (gene lists, collection names) across the process boundary.
+    Dense expression matrices are kept in shared memory up to
+    `shm_budget` bytes, least recently used first out; a matrix is never
+    released while a task using it is queued or running. Sparse matrices
+    are pickled to the worker with each task instead: scanpy modifies
+    them in place, so every worker would copy a shared one anyway.
+
+    With `n_workers` of 0 every task runs inline in the calling process.
+    Once closed, e.g. after a worker crashed, a pooled backend raises
+    ``BrokenProcessPool`` instead of running tasks.
+    '''
+
+    def __init__(self, msigdb, n_workers=N_WORKERS, shm_budget=None):
+        self.n_workers = n_workers
+        self.inline = n_workers == 0
+        self.broken = False
+        self._lock = threading.Lock()
+        self._handles = []
+        # key -> {'spec', 'handles', 'nbytes', 'pins'}, least recently used first
+        self._matrices = OrderedDict()
+        self._matrices_nbytes = 0
+        network = msigdb[['geneset', 'genesymbol', 'collection']]
+        self.network_spec, handles = publish_frame(network)
+        self._handles.extend(handles)
+        if shm_budget is None:
+            shm_budget = (int(float(SHM_BUDGET_MB) * 1024 ** 2) if SHM_BUDGET_MB
+                          else _shm_free_bytes() // 2)
+        self.shm_budget = shm_budget
+        if not self.inline:
+            self._pool = ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=mp.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.network_spec,),
+            )
+        else:
+            self._pool = None
+            # Use the same categorical frame the workers attach to
+            _set_network(attach_frame(self.network_spec, self._handles))
+        atexit.register(self.close)
+
+    def _submit(self, fn, *args, **kwargs):
+        # Another session may close the pool at any time
+        pool = self._pool
+        try:
+            if pool is None:
+                raise BrokenProcessPool('The compute backend is closed.')
+            try:
+                return pool.submit(_measured, fn, *args, **kwargs)
+            except RuntimeError as e:
+                # Raised by submit() after a concurrent shutdown
+                raise BrokenProcessPool('The compute backend is closed.') from e
+        except BrokenProcessPool:
+            self._mark_broken()
+            raise
+
+    def _result(self, future):
+        try:
+            result, usage = future.result()
+        except BrokenProcessPool:
+            self._mark_broken()
+            raise
+        _trace.record_worker_usage(usage)
+        return result
+
+    def _mark_broken(self):
+        # A worker died (e.g. OOM-killed); get_backend builds a new backend
+        self.broken = True
+        self.close()
+
+    def run(self, fn, *args, **kwargs):
+        '''Run a task in the pool and wait for its result.'''
+        if self.inline:
+            return fn(*args, **kwargs)
+        return self._result(self._submit(fn, *args, **kwargs))
+
+    def starmap(self, fn, arg_tuples):
+        '''Run `fn` over `arg_tuples` concurrently, preserving order.'''
+        if self.inline:
+            return [fn(*args) for args in arg_tuples]
+        futures = [self._submit(fn, *args) for args in arg_tuples]
+        return [self._result(future) for future in futures]
+
+    def start_workers(self):
+        '''Start every pool worker now rather than on the first tasks.
+
+        Workers are spawned lazily on submit; one no-op task per worker
+        makes them all start and run :func:`_init_worker`.
+        '''
+        if not self.inline:
+            self.starmap(_noop, [()] * self.n_workers)
+
+    def run_on_matrix(self, key, X, fn, *args):
+        '''Run `fn(matrix, *args)` on `X` shared under `key`.
+
+        `key` must identify `X` across calls; with a `key` of None, and for
+        sparse matrices, `X` is sent to the worker with the task instead.
+        Falls back to running `fn` inline on `X` itself in inline mode or
+        when `X` does not fit in the shared memory budget.
+        '''
+        from scipy import sparse
+
+        if self.inline:
+            return fn(X, *args)
+        if key is None or sparse.issparse(X):
+            return self.run(fn, X, *args)
+        with self._lock:
+            spec = self._share_matrix(key, X)
+        if spec is None:
+            return fn(X, *args)
+        try:
+            return self.run(fn, spec, *args)
+        finally:
+            with self._lock:
+                entry = self._matrices.get(key)
+                if entry is not None:
+                    entry['pins'] -= 1
+
+    def _share_matrix(self, key, X):
+        '''Publish `X` under `key` once and return its pinned spec, or None if it does not fit.
+
+        The caller must unpin the entry when its task is done.
+        '''
+        if key in self._matrices:
+            self._matrices.move_to_end(key)
+            entry = self._matrices[key]
+            entry['pins'] += 1
+            return entry['spec']
+
+        nbytes = np.asarray(X).nbytes
+
+        def too_big():
+            return self._matrices_nbytes + nbytes > self.shm_budget or _shm_free_bytes() < nbytes
+
+        # Evict least recently used matrices until the new one fits both the
+        # budget and the space actually left in /dev/shm. Pinned matrices have
+        # tasks that are queued or running and may not have attached yet.
+        for old in [k for k, entry in self._matrices.items() if entry['pins'] == 0]:
+            if not too_big():
+                break
+            self._evict(old)
+        if too_big():
+            return None
+
+        spec, handles = publish_matrix(X)
+        self._matrices[key] = {'spec': spec, 'handles': handles, 'nbytes': nbytes, 'pins': 1}
+        self._matrices_nbytes += nbytes
+        return spec
+
+    def _evict(self, key):
+        entry = self._matrices.pop(key)
+        self._matrices_nbytes -= entry['nbytes']
+        for shm in entry['handles']:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self, wait=False):
+        '''Shut down the pool and release all shared memory blocks.
+
+        With `wait`, block until the workers have exited, e.g. before the
+        process that owns the pool exits itself.
+        '''
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+        with self._lock:
+            for key in list(self._matrices):
+                self._evict(key)
+        for shm in self._handles:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._handles = []
+
+
+@st.cache_resource(validate=lambda backend: not backend.broken)
+def get_backend():
+    '''Return the process-wide compute backend shared by all sessions.
+
+    A backend whose pool broke is replaced on the next call.
+    '''
+    from ._gene_enrich import load_msigdb
+
+    msigdb, _ = load_msigdb()
+    return ComputeBackend(msigdb)
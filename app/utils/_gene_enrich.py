@@ -1,18 +1,21 @@
 import streamlit as st
-import decoupler as dc
 import os
 import pandas as pd
+from . import _trace
 
 
-@st.cache_data(ttl='1d')
+# Shared across sessions without copying; callers must not mutate the frame.
+@st.cache_resource(ttl='1d')
 def load_msigdb():
+    _trace.record_miss()
     if os.path.exists('data/msigdb.feather'):
         _msigdb = pd.read_feather('data/msigdb.feather')
     else:
+        import decoupler as dc
+
         _msigdb = dc.get_resource('MSigDB')
-        if not os.path.exists('data'):
-            os.makedirs('data')
-            _msigdb.to_feather('data/msigdb.feather')
+        os.makedirs('data', exist_ok=True)
+        _msigdb.to_feather('data/msigdb.feather')
     
     _msigdb = _msigdb[~_msigdb.duplicated(['geneset', 'genesymbol'])]
     unique_genesets = _msigdb['collection'].unique()
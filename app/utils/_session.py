@@ -0,0 +1,45 @@
+import hashlib
+import pickle
+import pandas as pd
+import streamlit as st
+
+
+def _fingerprint(inputs):
+    '''Hash `inputs`; DataFrames and Series are hashed by content.'''
+    digest = hashlib.sha1()
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            value = (list(value.columns) if isinstance(value, pd.DataFrame) else value.name,
+                     pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        digest.update(pickle.dumps(value))
+    return digest.hexdigest()
+
+
+def submitted(key, inputs, clicked):
+    '''Return whether results should be shown for the current `inputs`.
+
+    Pressing the run button stores a snapshot of the inputs it was pressed
+    with. Later reruns (e.g. from the result table widgets) keep showing the
+    results only while the inputs still match that snapshot, so editing an
+    input does not start a new computation until the button is pressed again.
+
+    Parameters
+    ----------
+    key : str
+        Session state key of the snapshot, unique within the app.
+    inputs : tuple
+        The inputs the computation depends on. Settings that only change how
+        the results are displayed can be left out.
+    clicked : bool
+        Whether the run button was pressed in this run.
+    '''
+    fingerprint = _fingerprint(inputs)
+    if clicked:
+        st.session_state[key] = fingerprint
+        return True
+    if key not in st.session_state:
+        return False
+    if st.session_state[key] != fingerprint:
+        st.info('Inputs changed. Press the run button to update the results.')
+        return False
+    return True
@@ -0,0 +1,93 @@
+import importlib
+import os
+import threading
+import time
+import streamlit as st
+
+
+# Set BIO_WEBUI_PREWARM=0 to skip the background warm-up.
+PREWARM = os.environ.get('BIO_WEBUI_PREWARM', '1') != '0'
+
+# Heavy libraries imported lazily by the apps, and the apps themselves.
+PREWARM_MODULES = [
+    'decoupler', 'scanpy', 'lifelines', 'seaborn', 'PyComplexHeatmap',
+    'app.ora', 'app.gsea', 'app.survival', 'app.ora_adata', 'app.gsea_adata',
+]
+
+SURVIVAL_CONFIG = 'data/survival_data.yaml'
+
+
+class StartupReport:
+    '''Timings collected while the process warms up.'''
+
+    def __init__(self):
+        self.records = []
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds, error=None):
+        with self._lock:
+            self.records.append({'step': step, 'seconds': round(seconds, 3), 'error': error})
+
+    def timed(self, step, fn, *args, **kwargs):
+        '''Call `fn` and record how long it took; errors are recorded, not raised.'''
+        start = time.perf_counter()
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            self.add(step, time.perf_counter() - start, error=repr(e))
+        else:
+            self.add(step, time.perf_counter() - start)
+
+    def to_df(self):
+        import pandas as pd
+
+        with self._lock:
+            return pd.DataFrame(self.records, columns=['step', 'seconds', 'error'])
+
+
+def _prewarm_cohorts(report):
+    '''Load the survival cohorts flagged with `prewarm: true`.'''
+    import yaml
+    from app import survival
+
+    if not os.path.exists(SURVIVAL_CONFIG):
+        return
+    with open(SURVIVAL_CONFIG, 'r') as file:
+        data = yaml.safe_load(file)
+    for name, cohort in data.items():
+        if cohort.get('prewarm', False):
+            report.timed(f'cohort {name}', survival.load_survival_data, data, name)
+
+
+def _prewarm(report):
+    '''Import heavy modules and fill the shared caches.'''
+    from . import _gene_enrich, _compute
+
+    start = time.perf_counter()
+    for module in PREWARM_MODULES:
+        report.timed(f'import {module}', importlib.import_module, module)
+    report.timed('load_msigdb', _gene_enrich.load_msigdb)
+    report.timed('compute backend', _compute.get_backend)
+    if _compute.N_WORKERS > 0:
+        report.timed(f'start {_compute.N_WORKERS} workers', lambda: _compute.get_backend().start_workers())
+    _prewarm_cohorts(report)
+    report.add('total', time.perf_counter() - start)
+    report.done.set()
+
+
+@st.cache_resource
+def start_prewarm():
+    '''Start warming the process in a background thread, once per process.
+
+    Called from the first script run, i.e. the first page load after the
+    server starts, not when the server itself starts.
+
+    Returns the :class:`StartupReport` that the thread fills in.
+    '''
+    report = StartupReport()
+    if PREWARM:
+        threading.Thread(target=_prewarm, args=(report,), name='bio-webui-prewarm', daemon=True).start()
+    else:
+        report.done.set()
+    return report
@@ -1,12 +1,7 @@
-from lifelines import KaplanMeierFitter
-from lifelines.statistics import logrank_test
-from lifelines import CoxPHFitter
 import anndata as ad
 import pandas as pd
 import numpy as np
-import scanpy as sc
-from matplotlib import pyplot as plt
-import seaborn as sns
+from matplotlib.figure import Figure
 from typing import List, Union
 import streamlit as st
 
@@ -88,6 +83,7 @@ class Survival(ad.AnnData):
         time_limit
             The time limit to be used for plotting the Kaplan-Meier curve.
         '''
+        import scanpy as sc
 
         if isinstance(groupby, str):
             survival_data = sc.get.obs_df(self, [groupby, event, time])
@@ -142,6 +138,10 @@ class Survival(ad.AnnData):
             pattle = None,
             ax = None
             ):
+        import seaborn as sns
+        from lifelines import KaplanMeierFitter
+        from lifelines.statistics import logrank_test
+
         if pattle is None:
             pattle = sns.color_palette(['#e41a1c', '#377eb8', '#984ea3', '#ff7f00'])
 
@@ -150,9 +150,7 @@ class Survival(ad.AnnData):
         survival_data['group'] = survival_data['group'].astype(str)
         
         if ax is None:
-            fig, ax = plt.subplots(figsize=figsize)
-        else:
-            fig = ax.get_figure()
+            ax = Figure(figsize=figsize).subplots()
 
         by_group = {}
         for (group, _df), color in zip(survival_data.groupby('group'), pattle):
@@ -164,7 +162,7 @@ class Survival(ad.AnnData):
         ax.set_xlabel(xlabel)
         ax.set_ylabel(ylabel)
         ax.legend(frameon=False)
-        sns.despine()
+        sns.despine(ax=ax)
 
         if self.group_method in {'median', 'quantile'}:
             results = logrank_test(
@@ -0,0 +1,232 @@
+import gzip
+import math
+import os
+import tempfile
+import time
+import weakref
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+
+
+PAGE_SIZES = [25, 50, 100, 500]
+# Rows per batch when writing exports, which bounds their extra memory.
+CHUNK_ROWS = 10_000
+EXPORT_FORMATS = {
+    'CSV (gzip)': 'csv.gz',
+    'Parquet': 'parquet',
+    'Arrow': 'arrow',
+}
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'bio_webui_exports')
+# Exports left behind by a process that did not exit cleanly are removed
+# after this many seconds.
+EXPORT_TTL = 86400
+
+
+def to_table(df):
+    '''Convert a result DataFrame into a columnar Arrow table.
+
+    Categorical columns are decoded to their values, so they can be
+    searched and sorted like the others.
+    '''
+    df = df.copy(deep=False)
+    df.columns = df.columns.astype(str)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+def search_table(table, query):
+    '''Keep rows where any string column contains `query` (case-insensitive).'''
+    if not query:
+        return table
+    mask = None
+    for name, column in zip(table.column_names, table.columns):
+        if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+            continue
+        match = pc.fill_null(pc.match_substring(column, query, ignore_case=True), False)
+        mask = match if mask is None else pc.or_(mask, match)
+    if mask is None:
+        return table.slice(0, 0)
+    return table.filter(mask)
+
+
+def sort_table(table, column, descending=False):
+    '''Sort `table` by `column`; nulls go last.'''
+    if column is None:
+        return table
+    return table.sort_by([(column, 'descending' if descending else 'ascending')])
+
+
+def write_export(table, fmt, path):
+    '''Write `table` to `path` in `CHUNK_ROWS` batches.
+
+    Parameters
+    ----------
+    fmt : str
+        One of ``'csv.gz'``, ``'parquet'`` or ``'arrow'``.
+    '''
+    batches = table.to_batches(max_chunksize=CHUNK_ROWS)
+    if fmt == 'csv.gz':
+        import pyarrow.csv as pa_csv
+
+        with gzip.open(path, 'wb') as file, pa_csv.CSVWriter(file, table.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    elif fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(path, table.schema) as writer:
+            for batch in batches:
+                writer.write_table(pa.Table.from_batches([batch], schema=table.schema))
+    elif fmt == 'arrow':
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    else:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+
+def _remove(path):
+    # Other sessions prune the same directory
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_files(paths):
+    for path in paths.values():
+        _remove(path)
+    paths.clear()
+
+
+class _SessionExports:
+    '''Export files of one session, keyed by table.
+
+    Kept in the session state, so the files are removed once the session
+    ends and its state is garbage collected (or when the process exits).
+    '''
+
+    def __init__(self):
+        self.paths = {}
+        self.exports = {}
+        weakref.finalize(self, _remove_files, self.paths)
+
+    def get(self, key):
+        return self.exports.get(key)
+
+    def set(self, key, fmt, fingerprint, path):
+        self.discard(key)
+        self.paths[key] = path
+        self.exports[key] = (fmt, fingerprint, path)
+
+    def discard(self, key):
+        self.exports.pop(key, None)
+        path = self.paths.pop(key, None)
+        if path is not None:
+            _remove(path)
+
+
+def _prune_exports():
+    now = time.time()
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            expired = now - entry.stat().st_mtime > EXPORT_TTL
+        except FileNotFoundError:
+            continue
+        if expired:
+            _remove(entry.path)
+
+
+def _fingerprint(df, *view):
+    '''Identify the content of `df` and the search/sort view shown of it.'''
+    return (df.shape, int(pd.util.hash_pandas_object(df, index=False).sum()), *view)
+
+
+def _export_controls(table, key, file_name, get_fingerprint):
+    if 'table_exports' not in st.session_state:
+        st.session_state['table_exports'] = _SessionExports()
+    exports = st.session_state['table_exports']
+    col1, col2 = st.columns(2, vertical_alignment='bottom')
+    with col1:
+        label = st.selectbox('Export format', list(EXPORT_FORMATS), key=f'{key}_export_format')
+    fmt = EXPORT_FORMATS[label]
+    with col2:
+        prepare = st.button('Prepare download', key=f'{key}_export_prepare', use_container_width=True)
+
+    export = exports.get(key)
+    if prepare or export is not None:
+        fingerprint = get_fingerprint()
+    # Drop an export as soon as it no longer matches what is shown
+    if export is not None and (export[0] != fmt or export[1] != fingerprint):
+        exports.discard(key)
+        export = None
+
+    if prepare:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        _prune_exports()
+        fd, path = tempfile.mkstemp(prefix=f'{key}_', suffix=f'.{fmt}', dir=EXPORT_DIR)
+        os.close(fd)
+        with st.spinner('Writing export...'):
+            write_export(table, fmt, path)
+        exports.set(key, fmt, fingerprint, path)
+        export = exports.get(key)
+
+    if export is not None and os.path.exists(export[2]):
+        # st.download_button holds the file in memory while it is offered
+        with open(export[2], 'rb') as file:
+            st.download_button(
+                f'Download {label} ({os.path.getsize(export[2]) / 1024 ** 2:.1f} MB)',
+                file, file_name=f'{file_name}.{fmt}', key=f'{key}_export_download')
+
+
+@st.fragment
+def paginated_dataframe(df, key, file_name='results'):
+    '''Show `df` one page at a time with search, sorting and export.
+
+    Only the current page is sent to the browser; searching and sorting run
+    on the server over an Arrow copy of the table. Exports are written to a
+    temporary file in batches, then offered for download until the table,
+    its view or the export format changes.
+
+    The table is a fragment: its widgets rerun only this function, not the
+    app that computed and plotted the results.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The result table.
+    key : str
+        Prefix for the widget keys, unique within the app.
+    file_name : str
+        Base name of the exported file.
+    '''
+    table = to_table(df)
+
+    col1, col2, col3 = st.columns([2, 2, 1], vertical_alignment='bottom')
+    with col1:
+        query = st.text_input('Search', key=f'{key}_search')
+    with col2:
+        sort_column = st.selectbox('Sort by', [None] + table.column_names, key=f'{key}_sort')
+    with col3:
+        descending = st.toggle('Descending', key=f'{key}_descending')
+    table = sort_table(search_table(table, query), sort_column, descending)
+
+    n_rows = table.num_rows
+    col1, col2 = st.columns(2)
+    with col1:
+        page_size = st.selectbox('Rows per page', PAGE_SIZES, key=f'{key}_page_size')
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    # A search can shrink the table below the page the user was on
+    if st.session_state.get(f'{key}_page', 1) > n_pages:
+        st.session_state[f'{key}_page'] = n_pages
+    with col2:
+        page = st.number_input('Page', min_value=1, max_value=n_pages, key=f'{key}_page')
+
+    st.dataframe(table.slice((page - 1) * page_size, page_size).to_pandas(), hide_index=True)
+    st.caption(f'{n_rows} rows · page {page} of {n_pages}')
+    _export_controls(table, key, file_name, lambda: _fingerprint(df, query, sort_column, descending))
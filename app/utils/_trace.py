@@ -0,0 +1,314 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+# Directory for trace.jsonl and metrics.prom; set to an empty string to disable.
+TRACE_DIR = os.environ.get('BIO_WEBUI_TRACE_DIR', 'logs')
+# trace.jsonl is rotated to trace.jsonl.1 ... trace.jsonl.<TRACE_BACKUPS> at this size.
+TRACE_MAX_MB = float(os.environ.get('BIO_WEBUI_TRACE_MAX_MB', 50))
+TRACE_BACKUPS = 3
+# Seconds between writes of the buffered records and metrics.
+FLUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_local = threading.local()
+# (app, stage) -> aggregated counters, shared by all sessions of the process
+_metrics = {}
+_metrics_dirty = False
+# Records waiting for the background writer
+_pending = queue.SimpleQueue()
+_writer = None
+_flush_lock = threading.Lock()
+
+# Seconds between RSS samples taken while a stage or pool task runs.
+SAMPLE_INTERVAL = 0.05
+
+
+def rss_mb(include_children=True):
+    '''Return the current RSS of this process and, optionally, its children.
+
+    The children are the compute pool workers, so stages that dispatch to
+    the pool are measured too.
+    '''
+    import psutil
+
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    if include_children:
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+    return rss / 1024 ** 2
+
+
+class _Sampler:
+    '''Background thread sampling the RSS while any measurement is active.
+
+    Each measurement keeps the highest sample seen since it started. The
+    thread exits when no measurement is left.
+    '''
+
+    def __init__(self, include_children):
+        self.include_children = include_children
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def start(self, token, rss):
+        with self._lock:
+            self._active[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='bio-webui-rss-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, token, rss):
+        with self._lock:
+            return max(self._active.pop(token), rss)
+
+    def _run(self):
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            rss = rss_mb(self.include_children)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                for token, peak in self._active.items():
+                    self._active[token] = max(peak, rss)
+
+
+_samplers = {True: _Sampler(True), False: _Sampler(False)}
+
+
+@contextmanager
+def measure_rss(include_children=True):
+    '''Measure the RSS growth of the enclosed block.
+
+    Yields a dict that is filled on exit with ``rss_delta_mb`` (RSS after
+    minus before) and ``peak_rss_delta_mb`` (highest sampled RSS minus
+    before). Without children only this process is measured, which is what
+    pool workers report for their own tasks.
+    '''
+    usage = {}
+    sampler = _samplers[include_children]
+    token = object()
+    before = rss_mb(include_children)
+    sampler.start(token, before)
+    try:
+        yield usage
+    finally:
+        after = rss_mb(include_children)
+        usage['rss_delta_mb'] = after - before
+        usage['peak_rss_delta_mb'] = sampler.stop(token, after) - before
+
+
+def start_run(app):
+    '''Start a new script run of `app`, clearing the session's stage records.'''
+    _local.app = app
+    if get_script_run_ctx() is not None:
+        st.session_state['trace'] = []
+
+
+@contextmanager
+def stage(name, cached=False, **sizes):
+    '''Time a stage of the current app.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. ``'perform_ora'``.
+    cached : bool
+        Whether the stage calls an ``st.cache_*`` function. The function
+        body must call :func:`record_miss` so hits and misses can be told
+        apart.
+    **sizes
+        Input sizes to record with the stage.
+    '''
+    record = {
+        'time': time.time(),
+        'app': getattr(_local, 'app', None),
+        'stage': name,
+        'sizes': sizes,
+    }
+    parent = getattr(_local, 'stage', None)
+    _local.stage = record
+    start = time.perf_counter()
+    try:
+        # RSS of this process and the pool workers; it includes whatever
+        # other sessions allocate meanwhile, unlike the worker figures
+        # reported by the tasks themselves
+        with measure_rss() as usage:
+            yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record.update(usage)
+        record['worker_peak_rss_delta_mb'] = record.pop('_worker_peak', None)
+        miss = record.pop('_miss', False)
+        record['cache'] = ('miss' if miss else 'hit') if cached else None
+        _local.stage = parent
+        _emit(record)
+
+
+def record_miss():
+    '''Mark the enclosing stage as a cache miss; call from cached function bodies.'''
+    record = getattr(_local, 'stage', None)
+    if record is not None:
+        record['_miss'] = True
+
+
+def record_worker_usage(usage):
+    '''Attach the RSS a pool task measured in its worker to the current stage.'''
+    record = getattr(_local, 'stage', None)
+    if record is not None:
+        record['_worker_peak'] = max(record.get('_worker_peak') or 0.0, usage['peak_rss_delta_mb'])
+
+
+def _emit(record):
+    global _metrics_dirty
+    if get_script_run_ctx() is not None:
+        st.session_state.setdefault('trace', []).append(record)
+
+    with _lock:
+        key = (record['app'], record['stage'])
+        metrics = _metrics.setdefault(key, {
+            'runs': 0, 'seconds': 0.0, 'last_seconds': 0.0,
+            'cache_hits': 0, 'cache_misses': 0, 'peak_rss_delta_mb': 0.0,
+            'worker_peak_rss_delta_mb': 0.0})
+        metrics['runs'] += 1
+        metrics['seconds'] += record['seconds']
+        metrics['last_seconds'] = record['seconds']
+        metrics['peak_rss_delta_mb'] = max(metrics['peak_rss_delta_mb'], record['peak_rss_delta_mb'])
+        if record['worker_peak_rss_delta_mb'] is not None:
+            metrics['worker_peak_rss_delta_mb'] = max(
+                metrics['worker_peak_rss_delta_mb'], record['worker_peak_rss_delta_mb'])
+        if record['cache'] == 'hit':
+            metrics['cache_hits'] += 1
+        elif record['cache'] == 'miss':
+            metrics['cache_misses'] += 1
+        _metrics_dirty = True
+
+    if TRACE_DIR:
+        # Files are written by a background thread, off the session's thread
+        _pending.put(record)
+        _start_writer()
+
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name='bio-webui-trace-writer', daemon=True)
+            _writer.start()
+            atexit.register(flush)
+
+
+def _write_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            # Keep the writer alive (e.g. through a full disk); the batch is lost
+            pass
+
+
+def _rotate(path):
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f'{path}.{i}'):
+            os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+    os.replace(path, f'{path}.1')
+
+
+def flush():
+    '''Write the buffered records to trace.jsonl and refresh metrics.prom.'''
+    global _metrics_dirty
+    with _flush_lock:
+        lines = []
+        while True:
+            try:
+                lines.append(json.dumps(_pending.get_nowait(), default=str) + '\n')
+            except queue.Empty:
+                break
+        with _lock:
+            text = _prometheus_text() if _metrics_dirty else None
+            _metrics_dirty = False
+        if not TRACE_DIR or not (lines or text):
+            return
+
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        if lines:
+            path = os.path.join(TRACE_DIR, 'trace.jsonl')
+            with open(path, 'a') as file:
+                file.writelines(lines)
+            if os.path.getsize(path) >= TRACE_MAX_MB * 1024 ** 2:
+                _rotate(path)
+        if text is not None:
+            tmp_path = os.path.join(TRACE_DIR, 'metrics.prom.tmp')
+            with open(tmp_path, 'w') as file:
+                file.write(text)
+            os.replace(tmp_path, os.path.join(TRACE_DIR, 'metrics.prom'))
+
+
+_PROMETHEUS_METRICS = [
+    ('runs', 'bio_webui_stage_runs_total', 'counter', 'Number of times each stage ran.'),
+    ('seconds', 'bio_webui_stage_seconds_total', 'counter', 'Total wall time spent in each stage.'),
+    ('last_seconds', 'bio_webui_stage_last_seconds', 'gauge', 'Wall time of the latest run of each stage.'),
+    ('cache_hits', 'bio_webui_stage_cache_hits_total', 'counter', 'Cache hits of cached stages.'),
+    ('cache_misses', 'bio_webui_stage_cache_misses_total', 'counter', 'Cache misses of cached stages.'),
+    ('peak_rss_delta_mb', 'bio_webui_stage_peak_rss_delta_megabytes', 'gauge',
+     'Largest sampled RSS growth of the process and its pool workers during one run of each stage.'),
+    ('worker_peak_rss_delta_mb', 'bio_webui_stage_worker_peak_rss_delta_megabytes', 'gauge',
+     'Largest RSS growth of a pool worker during one task of each stage.'),
+]
+
+
+def _prometheus_text():
+    lines = []
+    for field, metric, kind, help_text in _PROMETHEUS_METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for (app, stage_name), metrics in sorted(_metrics.items(), key=str):
+            lines.append(f'{metric}{{app="{app}",stage="{stage_name}"}} {metrics[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_text():
+    '''Return the aggregated stage metrics in Prometheus text format.'''
+    with _lock:
+        return _prometheus_text()
+
+
+def session_df():
+    '''Return the stages recorded during the session's latest run.'''
+    import pandas as pd
+
+    records = st.session_state.get('trace', [])
+    columns = ['stage', 'seconds', 'RSS Δ (MB)', 'peak RSS Δ (MB)', 'worker peak RSS Δ (MB)', 'cache', 'sizes']
+    return pd.DataFrame(
+        [{'stage': r['stage'], 'seconds': round(r['seconds'], 3),
+          'RSS Δ (MB)': round(r['rss_delta_mb'], 1),
+          'peak RSS Δ (MB)': round(r['peak_rss_delta_mb'], 1),
+          'worker peak RSS Δ (MB)': (None if r['worker_peak_rss_delta_mb'] is None
+                                     else round(r['worker_peak_rss_delta_mb'], 1)),
+          'cache': r['cache'],
+          'sizes': ', '.join(f'{k}={v}' for k, v in r['sizes'].items())}
+         for r in records],
+        columns=columns)
+
+
+def process_df():
+    '''Return the stage metrics aggregated over all sessions of the process.'''
+    import pandas as pd
+
+    with _lock:
+        rows = [{'app': app, 'stage': stage_name, **metrics} for (app, stage_name), metrics in _metrics.items()]
+    return pd.DataFrame(rows)
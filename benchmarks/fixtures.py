@@ -0,0 +1,181 @@
+'''Deterministic synthetic inputs shaped like the production workloads.
+
+Every generator takes a size tier (see ``TIERS``) and a seed, so two runs of
+the benchmark suite on different machines see exactly the same data.
+'''
+import os
+import numpy as np
+import pandas as pd
+
+
+TIERS = {
+    'small': {
+        'n_genes': 5000, 'n_genesets': 500, 'geneset_size': 50,
+        'n_samples': 100, 'n_cohort_genes': 2000,
+        'n_cells': 2000, 'n_atlas_genes': 2000, 'n_clusters': 10, 'density': 0.1,
+    },
+    'medium': {
+        'n_genes': 20000, 'n_genesets': 5000, 'geneset_size': 100,
+        'n_samples': 500, 'n_cohort_genes': 20000,
+        'n_cells': 20000, 'n_atlas_genes': 10000, 'n_clusters': 40, 'density': 0.05,
+    },
+    # Roughly the size of MSigDB, a large TCGA cohort and a mid-size atlas.
+    'large': {
+        'n_genes': 40000, 'n_genesets': 35000, 'geneset_size': 100,
+        'n_samples': 1100, 'n_cohort_genes': 20000,
+        'n_cells': 100000, 'n_atlas_genes': 15000, 'n_clusters': 100, 'density': 0.02,
+    },
+}
+
+COLLECTIONS = [
+    'hallmark', 'kegg_pathways', 'reactome_pathways', 'go_biological_process',
+    'go_molecular_function', 'go_cellular_component', 'wikipathways',
+    'oncogenic_signatures', 'immunesigdb', 'cell_type_signatures',
+]
+
+
+def gene_names(n):
+    return np.array([f'GENE{i}' for i in range(n)])
+
+
+def make_msigdb(tier, seed=0):
+    '''Return an MSigDB-shaped network with `collection`, `geneset` and `genesymbol`.
+
+    Gene set sizes follow a log-normal distribution around ``geneset_size``
+    and gene membership is skewed so a few genes appear in many sets, as in
+    the real resource.
+    '''
+    params = TIERS[tier]
+    rng = np.random.default_rng(seed)
+    genes = gene_names(params['n_genes'])
+    # Zipf-like popularity of genes across gene sets
+    popularity = 1.0 / np.arange(1, params['n_genes'] + 1) ** 0.5
+    popularity /= popularity.sum()
+
+    sizes = rng.lognormal(np.log(params['geneset_size']), 0.6, params['n_genesets']).astype(int)
+    sizes = np.clip(sizes, 5, 2000)
+    collections = rng.choice(COLLECTIONS, params['n_genesets'])
+
+    rows_collection, rows_geneset, rows_gene = [], [], []
+    for i, (size, collection) in enumerate(zip(sizes, collections)):
+        # Sampling with replacement is much faster; duplicates shrink the set slightly
+        members = np.unique(rng.choice(params['n_genes'], size=size, p=popularity))
+        geneset = f'{collection.upper()}_SET_{i}'
+        rows_collection.append(np.repeat(collection, len(members)))
+        rows_geneset.append(np.repeat(geneset, len(members)))
+        rows_gene.append(genes[members])
+
+    return pd.DataFrame({
+        'genesymbol': np.concatenate(rows_gene),
+        'collection': np.concatenate(rows_collection),
+        'geneset': np.concatenate(rows_geneset),
+    })
+
+
+def make_gene_list(tier, n=200, seed=1):
+    '''Return `n` genes biased towards the gene sets' popular genes.'''
+    params = TIERS[tier]
+    rng = np.random.default_rng(seed)
+    genes = gene_names(params['n_genes'])
+    return list(genes[rng.choice(params['n_genes'] // 4, size=n, replace=False)])
+
+
+def make_ranked_genes(tier, seed=2):
+    '''Return a ranked gene table with a `stat` column, as built by the GSEA app.'''
+    params = TIERS[tier]
+    rng = np.random.default_rng(seed)
+    genes = gene_names(params['n_genes'])
+    stat = np.sort(rng.standard_t(5, params['n_genes']))[::-1]
+    return pd.DataFrame(index=genes, data={'stat': stat}, columns=['stat'])
+
+
+def write_tcga(tier, out_dir, seed=3):
+    '''Write a TCGA-like expression/metadata TSV pair and return their paths.
+
+    The expression table is genes x samples and the metadata carries
+    OS/DSS/PFI events and times, with survival partly driven by the first
+    gene so KM curves separate.
+    '''
+    params = TIERS[tier]
+    rng = np.random.default_rng(seed)
+    samples = [f'TCGA-{i:02d}-{j:04d}-01' for i, j in zip(
+        rng.integers(0, 100, params['n_samples']), range(params['n_samples']))]
+    genes = gene_names(params['n_cohort_genes'])
+    exp = rng.lognormal(1.0, 1.0, (params['n_cohort_genes'], params['n_samples'])).astype(np.float32)
+    exp = pd.DataFrame(np.log2(exp + 1), index=pd.Index(genes, name='gene'), columns=samples)
+
+    risk = exp.iloc[0].to_numpy()
+    meta = pd.DataFrame({'sample': samples})
+    for metric in ['OS', 'DSS', 'PFI']:
+        meta[f'{metric}.time'] = rng.exponential(1500 / np.exp(risk - risk.mean()))
+        meta[metric] = (rng.random(params['n_samples']) < 0.4).astype(int)
+
+    exp_path = os.path.join(out_dir, f'tcga_{tier}.exp.tsv')
+    meta_path = os.path.join(out_dir, f'tcga_{tier}.meta.tsv')
+    exp.to_csv(exp_path, sep='\t')
+    meta.to_csv(meta_path, sep='\t', index=False)
+    return exp_path, meta_path
+
+
+def make_atlas(tier, seed=4):
+    '''Return a sparse, log-normalised AnnData with a `leiden` clustering.
+
+    Each cluster over-expresses its own block of marker genes so that
+    rank_genes_groups finds real differences.
+    '''
+    import anndata as ad
+    from scipy import sparse
+
+    params = TIERS[tier]
+    rng = np.random.default_rng(seed)
+    n_cells, n_genes = params['n_cells'], params['n_atlas_genes']
+    clusters = rng.integers(0, params['n_clusters'], n_cells)
+
+    X = sparse.random(
+        n_cells, n_genes, density=params['density'], format='csr',
+        dtype=np.float32, random_state=seed,
+        data_rvs=lambda n: rng.gamma(1.5, 1.0, n).astype(np.float32))
+    markers_per_cluster = max(n_genes // (params['n_clusters'] * 4), 5)
+    rows, cols, vals = [], [], []
+    for c in range(params['n_clusters']):
+        cells = np.flatnonzero(clusters == c)
+        markers = (c * markers_per_cluster + np.arange(markers_per_cluster)) % n_genes
+        r, m = np.nonzero(rng.random((len(cells), markers_per_cluster)) < 0.5)
+        rows.append(cells[r])
+        cols.append(markers[m])
+        vals.append(rng.gamma(3.0, 1.0, len(r)).astype(np.float32))
+    boost = sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(n_cells, n_genes))
+    X = X + boost
+    X = X.tocsr()
+    X.data = np.log1p(X.data)
+
+    obs = pd.DataFrame(
+        {'leiden': pd.Categorical(clusters.astype(str), categories=[str(c) for c in range(params['n_clusters'])])},
+        index=[f'cell{i}' for i in range(n_cells)])
+    var = pd.DataFrame(index=gene_names(n_genes))
+    return ad.AnnData(X=X, obs=obs, var=var)
+
+
+def write_fixtures(tier, out_dir):
+    '''Write every on-disk fixture for `tier` under `out_dir`.
+
+    The MSigDB network goes to ``data/msigdb.feather`` because that is where
+    `load_msigdb` looks for it.
+    '''
+    os.makedirs(os.path.join(out_dir, 'data'), exist_ok=True)
+    msigdb_path = os.path.join(out_dir, 'data', 'msigdb.feather')
+    if not os.path.exists(msigdb_path):
+        make_msigdb(tier).to_feather(msigdb_path)
+
+    paths = {'msigdb': msigdb_path}
+    tcga_paths = [os.path.join(out_dir, f'tcga_{tier}.{kind}.tsv') for kind in ('exp', 'meta')]
+    if not all(os.path.exists(path) for path in tcga_paths):
+        tcga_paths = write_tcga(tier, out_dir)
+    paths['tcga_exp'], paths['tcga_meta'] = tcga_paths
+
+    atlas_path = os.path.join(out_dir, f'atlas_{tier}.h5ad')
+    if not os.path.exists(atlas_path):
+        make_atlas(tier).write_h5ad(atlas_path)
+    paths['atlas'] = atlas_path
+    return paths
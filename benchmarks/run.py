@@ -0,0 +1,380 @@
+'''Benchmark the Bio WebUI hot paths on synthetic fixtures.
+
+Each case runs in a fresh process so its wall time and peak RSS are not
+polluted by earlier cases. Results can be saved as a baseline and later runs
+compared against it.
+
+Examples
+--------
+    python benchmarks/run.py --tier small
+    python benchmarks/run.py --tier small medium --save-baseline
+    python benchmarks/run.py --tier medium --check
+    python benchmarks/run.py --tier large --workers 4 8
+'''
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from queue import Empty
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+import fixtures  # noqa: E402
+
+
+BASELINE = ROOT / 'benchmarks' / 'baseline.json'
+COLLECTIONS = ['hallmark', 'kegg_pathways']
+# Pool size used in production by default, see app/utils/_compute.py
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+CASES = {}
+# Cases whose timed part dispatches to the compute pool
+POOL_CASES = set()
+# Seconds a case process may take to exit after reporting its result
+EXIT_TIMEOUT = 30
+
+
+def case(name, pool=False):
+    '''Register a benchmark case.
+
+    The decorated function receives the fixture paths and tier, does any
+    untimed setup and returns the zero-argument callable to time. Cases
+    with `pool` run once per ``--workers`` value; the others run inline.
+    '''
+    def register(setup):
+        CASES[name] = setup
+        if pool:
+            POOL_CASES.add(name)
+        return setup
+    return register
+
+
+def _rank_genes_df(paths):
+    import anndata as ad
+    from app import ora_adata
+
+    adata = ad.read_h5ad(paths['atlas'])
+    return ora_adata.get_rank_genes(
+        adata, groupby='leiden', key='rank_genes_groups_filtered',
+        layer=None, n_genes=20, adata_path=paths['atlas'])
+
+
+def _survival(paths):
+    from app.utils import _survival
+
+    return _survival.Survival(paths['tcga_exp'], paths['tcga_meta'], meta_index_col='sample')
+
+
+def _signature(tier):
+    return list(fixtures.gene_names(fixtures.TIERS[tier]['n_cohort_genes'])[:10])
+
+
+@case('load_msigdb')
+def bench_load_msigdb(paths, tier):
+    from app.utils import load_msigdb
+
+    # Bypass st.cache_resource so every repeat reads the feather file
+    return getattr(load_msigdb, '__wrapped__', load_msigdb)
+
+
+@case('perform_ora', pool=True)
+def bench_perform_ora(paths, tier):
+    from app import ora
+
+    genes = fixtures.make_gene_list(tier)
+    return lambda: ora.perform_ora(genes, COLLECTIONS, 0.05)
+
+
+@case('perform_gsea', pool=True)
+def bench_perform_gsea(paths, tier):
+    from app import gsea
+
+    ranked_genes = fixtures.make_ranked_genes(tier)
+    return lambda: gsea.perform_gsea(ranked_genes, COLLECTIONS, 0.05)
+
+
+@case('get_rank_genes', pool=True)
+def bench_get_rank_genes(paths, tier):
+    import anndata as ad
+    from app import ora_adata
+
+    adata = ad.read_h5ad(paths['atlas'])
+
+    def run():
+        adata.uns.pop('rank_genes_groups_filtered', None)
+        ora_adata.get_rank_genes(
+            adata, groupby='leiden', key='rank_genes_groups_filtered',
+            layer=None, n_genes=20, adata_path=paths['atlas'])
+    return run
+
+
+@case('run_ora', pool=True)
+def bench_run_ora(paths, tier):
+    from app import ora_adata
+
+    rank_genes_df = _rank_genes_df(paths)
+    return lambda: ora_adata.run_ora(rank_genes_df, COLLECTIONS, n_top=10)
+
+
+@case('survival_init')
+def bench_survival_init(paths, tier):
+    return lambda: _survival(paths)
+
+
+@case('group_meta')
+def bench_group_meta(paths, tier):
+    survival = _survival(paths)
+    genes = _signature(tier)
+    return lambda: survival.group_meta(groupby=genes, group_method='median')
+
+
+@case('km_plot')
+def bench_km_plot(paths, tier):
+    survival = _survival(paths)
+    survival.group_meta(groupby=_signature(tier), group_method='median')
+    return survival.km_plot
+
+
+@case('plot_ora')
+def bench_plot_ora(paths, tier):
+    from app import ora
+
+    enr = ora.perform_ora(fixtures.make_gene_list(tier), COLLECTIONS, 1.0)
+    return lambda: ora.plot_results(enr, 10, '#ADD8E6')
+
+
+@case('plot_gsea')
+def bench_plot_gsea(paths, tier):
+    from app import gsea
+
+    enr = gsea.perform_gsea(fixtures.make_ranked_genes(tier), COLLECTIONS, 1.0)
+    return lambda: gsea.plot_results(enr, 10, '#ADD8E6')
+
+
+@case('plot_ora_adata', pool=True)
+def bench_plot_ora_adata(paths, tier):
+    import matplotlib.pyplot as plt
+    from app import ora_adata
+
+    rank_genes_df = _rank_genes_df(paths)
+
+    def run():
+        ora_adata.plot_results(rank_genes_df, COLLECTIONS, 10)
+        plt.close('all')
+    return run
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _bench_rss_mb(rss_before, usage):
+    # ru_maxrss catches short spikes of this process; the sampled RSS
+    # also covers the compute pool workers
+    return max(_peak_rss_mb(), rss_before + usage['peak_rss_delta_mb'])
+
+
+def _run_case(name, tier, workers, paths, repeat, queue):
+    '''Child process entry point: set up, time and report one case.'''
+    backend = None
+    try:
+        import streamlit as st
+        from streamlit import logger as st_logger
+        from app.utils import _compute, _trace
+
+        # Cases run outside `streamlit run`, which streamlit warns about on
+        # every cached call; its loggers each have their own level
+        st_logger.set_log_level('error')
+        # The plots ask for Arial, which many servers lack
+        logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+        os.chdir(paths['root'])
+        rss_start = _trace.rss_mb()
+        with _trace.measure_rss() as case_usage:
+            fn = CASES[name](paths, tier)
+            if name in POOL_CASES:
+                # Like the app's warm-up, so neither loading MSigDB into the
+                # backend nor worker startup is timed
+                backend = _compute.get_backend()
+                backend.start_workers()
+                if backend.inline:
+                    # The workers import these on startup, so inline runs
+                    # import them here rather than in the first repeat
+                    for module in _compute.WORKER_MODULES:
+                        importlib.import_module(module)
+            times = []
+            with _trace.measure_rss() as usage:
+                for _ in range(repeat):
+                    # Time the computation, not a cache hit
+                    st.cache_data.clear()
+                    start = time.perf_counter()
+                    fn()
+                    times.append(time.perf_counter() - start)
+        queue.put({
+            'case': name,
+            'tier': tier,
+            'workers': workers,
+            'wall_s': min(times),
+            'wall_s_median': statistics.median(times),
+            'peak_rss_mb': _bench_rss_mb(rss_start, case_usage),
+            'peak_rss_delta_mb': usage['peak_rss_delta_mb'],
+        })
+    except Exception as e:
+        queue.put({'case': name, 'tier': tier, 'workers': workers, 'error': repr(e)})
+    finally:
+        # The pool workers are not daemons, so multiprocessing would join them
+        # at exit before the backend's atexit hook ever shuts the pool down;
+        # wait for them, as workers left behind keep the benchmark's stdout open.
+        if backend is not None:
+            backend.close(wait=True)
+
+
+def run_case(name, tier, workers, paths, repeat, timeout):
+    '''Run one case in a fresh process, giving up after `timeout` seconds.
+
+    A child that crashes (e.g. killed by the OOM killer) or times out is
+    reported as an error result. A child that does not exit within
+    `EXIT_TIMEOUT` seconds of reporting is terminated.
+    '''
+    # The child reads the pool size when it imports app.utils._compute
+    os.environ['BIO_WEBUI_COMPUTE_WORKERS'] = str(workers)
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_case, args=(name, tier, workers, paths, repeat, queue))
+    process.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                # The result may still be in the pipe when the child exits
+                try:
+                    result = queue.get(timeout=1)
+                except Empty:
+                    result = {'case': name, 'tier': tier, 'workers': workers,
+                              'error': f'process exited with code {process.exitcode}'}
+            elif time.monotonic() > deadline:
+                process.terminate()
+                result = {'case': name, 'tier': tier, 'workers': workers,
+                          'error': f'timed out after {timeout}s'}
+    process.join(EXIT_TIMEOUT)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    return result
+
+
+def result_key(result):
+    return f"{result['tier']}/{result['case']}/w{result['workers']}"
+
+
+def compare(results, baseline, tolerance, rss_tolerance):
+    '''Annotate `results` with their ratios to the baseline; return the regressions.
+
+    A case is a regression if it errored, or if its wall time or peak RSS
+    exceeds the baseline by more than `tolerance` or `rss_tolerance`.
+    '''
+    regressions = []
+    for result in results:
+        if 'error' in result:
+            regressions.append(result)
+            continue
+        ref = baseline.get(result_key(result))
+        if ref is None:
+            continue
+        result['ratio'] = result['wall_s'] / ref['wall_s']
+        result['rss_ratio'] = result['peak_rss_mb'] / ref['peak_rss_mb']
+        if result['ratio'] > 1 + tolerance or result['rss_ratio'] > 1 + rss_tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def print_results(results):
+    print(f"{'tier':<8}{'case':<18}{'workers':>8}{'wall (s)':>10}{'median (s)':>12}{'peak RSS (MB)':>15}"
+          f"{'ΔRSS (MB)':>11}{'vs base':>9}{'RSS vs base':>13}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['tier']:<8}{r['case']:<18}{r['workers']:>8}  ERROR {r['error']}")
+            continue
+        ratio = f"{r['ratio']:.2f}x" if 'ratio' in r else '-'
+        rss_ratio = f"{r['rss_ratio']:.2f}x" if 'rss_ratio' in r else '-'
+        print(f"{r['tier']:<8}{r['case']:<18}{r['workers']:>8}{r['wall_s']:>10.3f}{r['wall_s_median']:>12.3f}"
+              f"{r['peak_rss_mb']:>15.1f}{r['peak_rss_delta_mb']:>11.1f}{ratio:>9}{rss_ratio:>13}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tier', nargs='+', default=['small'], choices=list(fixtures.TIERS))
+    parser.add_argument('--case', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repeats per case; the minimum is reported.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, DEFAULT_WORKERS],
+                        help='BIO_WEBUI_COMPUTE_WORKERS values to run the pool cases with '
+                             f'(default: 0 {DEFAULT_WORKERS}, i.e. inline and the production pool size).')
+    parser.add_argument('--fixtures-dir', type=Path, default=Path(tempfile.gettempdir()) / 'bio_webui_bench',
+                        help='Where fixtures are written and reused between runs.')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Overwrite the baseline with this run.')
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 on regressions.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown before flagging (0.2 = 20%%).')
+    parser.add_argument('--rss-tolerance', type=float, default=0.2,
+                        help='Allowed peak RSS growth before flagging (0.2 = 20%%).')
+    parser.add_argument('--timeout', type=float, default=1800, help='Seconds before a case is killed.')
+    parser.add_argument('--output', type=Path, help='Also write the results as JSON.')
+    args = parser.parse_args(argv)
+
+    os.environ['BIO_WEBUI_PREWARM'] = '0'
+    # Keep the trace writer thread out of the timings
+    os.environ['BIO_WEBUI_TRACE_DIR'] = ''
+
+    results = []
+    for tier in args.tier:
+        tier_dir = (args.fixtures_dir / tier).resolve()
+        print(f'Preparing {tier} fixtures in {tier_dir} ...', flush=True)
+        paths = fixtures.write_fixtures(tier, str(tier_dir))
+        paths['root'] = str(tier_dir)
+        for name in args.case:
+            for workers in (args.workers if name in POOL_CASES else [0]):
+                print(f'  {name} (workers={workers})', flush=True)
+                results.append(run_case(name, tier, workers, paths, args.repeat, args.timeout))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.tolerance, args.rss_tolerance)
+    print_results(results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baseline.update({result_key(r): r for r in results if 'error' not in r})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        print(f'Baseline written to {args.baseline}')
+    missing = [r for r in results if 'error' not in r and result_key(r) not in baseline]
+    if args.check and missing:
+        print(f'{len(missing)} case(s) have no baseline in {args.baseline} and were not compared. '
+              'Record one on this machine with --save-baseline, see the readme.')
+    if regressions:
+        print(f'{len(regressions)} case(s) failed, or exceeded the baseline by more than '
+              f'{args.tolerance:.0%} in wall time or {args.rss_tolerance:.0%} in peak RSS:')
+        for r in regressions:
+            if 'error' in r:
+                print(f"  {result_key(r)}: ERROR {r['error']}")
+            else:
+                print(f"  {result_key(r)}: {r['ratio']:.2f}x wall, {r['rss_ratio']:.2f}x peak RSS")
+        if args.check:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
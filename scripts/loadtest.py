@@ -0,0 +1,304 @@
+'''Simulate concurrent Bio WebUI sessions against a real Streamlit server.
+
+Each simulated user opens a websocket session on a `streamlit run webui.py`
+server, picks an app, fills in its inputs and presses the run button; the
+script reports per-session latency so the effect of the compute pool
+(``BIO_WEBUI_COMPUTE_WORKERS``) can be compared. All sessions live in the
+one server process and share its caches and pool, as browser sessions do.
+
+Every session submits its own seeded random subset of the gene list, and
+the warm-up session yet another, so no session is served from the
+``st.cache_data`` results of another and each pays for its own analysis.
+
+The sessions speak Streamlit's websocket protocol directly: they read the
+widgets with ``streamlit.testing`` and send the states of the widgets they
+change, as the browser does. They need the ``websockets`` package, which is
+not in requirement.txt: install it with ``pip install websockets``.
+
+Example
+-------
+    BIO_WEBUI_COMPUTE_WORKERS=4 python scripts/loadtest.py --users 8 --app "ORA (genes)" --genes-file genes.txt
+    python scripts/loadtest.py --users 8 --url http://localhost:8501
+'''
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+from streamlit.testing.v1.element_tree import parse_tree_from_messages
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_GENES = (
+    'TP53 MYC EGFR KRAS PTEN BRCA1 BRCA2 CDK4 CDKN2A RB1 PIK3CA AKT1 MTOR '
+    'VEGFA HIF1A STAT3 JAK2 IL6 TNF NFKB1 CCND1 MDM2 ERBB2 SMAD4 APC'
+)
+
+
+def select(widget, option):
+    '''Return the state of a selectbox set to `option`.'''
+    return WidgetState(id=widget.id, int_value=list(widget.proto.options).index(option))
+
+
+def enter(widget, text):
+    '''Return the state of a text input or text area holding `text`.'''
+    return WidgetState(id=widget.id, string_value=text)
+
+
+def click(widget):
+    '''Return the state of a button that was just pressed.'''
+    return WidgetState(id=widget.id, trigger_value=True)
+
+
+class Session:
+    '''One browser-like session on the server's websocket.'''
+
+    def __init__(self, websocket, timeout):
+        self.websocket = websocket
+        self.timeout = timeout
+        self.page_script_hash = ''
+        # Messages the server may later send as ref_hash references
+        self._cache = {}
+        self.tree = None
+        # Widget id -> the state this session set it to
+        self._states = {}
+
+    async def _receive(self):
+        msg = ForwardMsg()
+        msg.ParseFromString(await self.websocket.recv())
+        if msg.HasField('ref_hash'):
+            ref = msg
+            msg = ForwardMsg()
+            msg.CopyFrom(self._cache[ref.ref_hash])
+            msg.metadata.CopyFrom(ref.metadata)
+        elif msg.hash:
+            self._cache[msg.hash] = msg
+        return msg
+
+    async def run(self, widget_states=None):
+        '''Rerun the script with `widget_states` and wait until it finishes.'''
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ''
+        back_msg.rerun_script.page_script_hash = self.page_script_hash
+        if widget_states is not None:
+            back_msg.rerun_script.widget_states.CopyFrom(widget_states)
+        await self.websocket.send(back_msg.SerializeToString())
+        await asyncio.wait_for(self._collect(), self.timeout)
+        if self.tree.exception:
+            raise RuntimeError(self.tree.exception[0].message)
+        return self.tree
+
+    async def _collect(self):
+        messages = []
+        while True:
+            msg = await self._receive()
+            kind = msg.WhichOneof('type')
+            if kind == 'new_session':
+                # A new script run replaces the previous elements
+                messages = []
+                self.page_script_hash = msg.new_session.page_script_hash
+            elif kind == 'delta':
+                messages.append(msg)
+            elif kind == 'script_finished':
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError('webui.py failed to compile')
+                self.tree = parse_tree_from_messages(messages)
+                return
+
+    async def interact(self, update):
+        '''Rerun with the widget states `update(tree)` returns.
+
+        The states come from :func:`select`, :func:`enter` and :func:`click`.
+        The tree's own widget states cannot be used: reading them needs the
+        session state of an ``AppTest`` run. Widgets left out keep their
+        value on the server.
+        '''
+        for state in update(self.tree):
+            self._states[state.id] = state
+        widget_states = WidgetStates()
+        widget_states.widgets.extend(self._states.values())
+        # A click is sent once, like the browser does
+        self._states = {key: state for key, state in self._states.items()
+                        if state.WhichOneof('value') != 'trigger_value'}
+        return await self.run(widget_states)
+
+
+class StartLine:
+    '''Release the sessions together once each is ready or has failed.'''
+
+    def __init__(self, n):
+        self._waiting = n
+        self._event = asyncio.Event()
+
+    def leave(self):
+        self._waiting -= 1
+        if self._waiting == 0:
+            self._event.set()
+
+    async def wait(self):
+        self.leave()
+        await self._event.wait()
+
+
+def session_inputs(genes, n, first_seed=0, fraction=0.8):
+    '''Return `n` distinct (genes, stats) inputs, each a seeded subset of `genes`.
+
+    The same `first_seed` always gives the same inputs, so runs compare.
+    '''
+    genes = genes.split()
+    size = max(1, round(len(genes) * fraction))
+    inputs, seen = [], set()
+    seed = first_seed
+    while len(inputs) < n:
+        if seed - first_seed > 100 * n:
+            raise ValueError(f'{len(genes)} genes are too few for {n} distinct sessions.')
+        subset = random.Random(seed).sample(genes, size)
+        seed += 1
+        if frozenset(subset) in seen:
+            continue
+        seen.add(frozenset(subset))
+        stats = ' '.join(str(size - i) for i in range(size))
+        inputs.append((' '.join(subset), stats))
+    return inputs
+
+
+async def run_session(url, app, genes, stats, timeout, start):
+    '''Drive one session end to end and return its latency in seconds.'''
+    if app not in ('ORA (genes)', 'GSEA (genes)'):
+        raise ValueError(f'Load testing is not supported for {app!r}.')
+    ws_url = url.replace('http', 'ws', 1).rstrip('/') + '/_stcore/stream'
+    ready = False
+    try:
+        async with websockets.connect(ws_url, subprotocols=['streamlit'], max_size=None) as websocket:
+            session = Session(websocket, timeout)
+            await session.run()
+            await session.interact(lambda tree: [select(tree.sidebar.selectbox[0], app)])
+
+            # Start every session's analysis at the same time
+            ready = True
+            await start.wait()
+            begin = time.perf_counter()
+            if app == 'ORA (genes)':
+                await session.interact(lambda tree: [enter(tree.text_area[0], genes)])
+            else:
+                await session.interact(lambda tree: [enter(tree.text_area[0], genes),
+                                                     enter(tree.text_area[1], stats)])
+            await session.interact(lambda tree: [click(tree.button[0])])
+            return time.perf_counter() - begin
+    finally:
+        if not ready:
+            start.leave()
+
+
+async def run_sessions(url, app, inputs, timeout):
+    '''Run one session per (genes, stats) input concurrently.
+
+    Failed sessions return their exception.
+    '''
+    start = StartLine(len(inputs))
+    return await asyncio.gather(
+        *(run_session(url, app, genes, stats, timeout, start) for genes, stats in inputs),
+        return_exceptions=True)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_healthy(url, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f'streamlit exited with code {server.returncode}')
+        try:
+            with urllib.request.urlopen(url.rstrip('/') + '/_stcore/health', timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f'{url} did not become healthy within {timeout}s')
+
+
+def start_server():
+    '''Start `streamlit run webui.py` on a free port and return (process, url).'''
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', str(ROOT / 'webui.py'),
+         '--server.headless=true', f'--server.port={port}', '--browser.gatherUsageStats=false'],
+        # The apps resolve `data/` relative to the working directory.
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return server, f'http://localhost:{port}'
+
+
+def main(argv=None):
+    if websockets is None:
+        sys.exit('scripts/loadtest.py needs the websockets package: pip install websockets')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=5, help='Number of concurrent sessions.')
+    parser.add_argument('--app', default='ORA (genes)', choices=['ORA (genes)', 'GSEA (genes)'])
+    parser.add_argument('--genes-file', type=Path, help='Whitespace separated gene list.')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-run timeout in seconds.')
+    parser.add_argument('--url', help='Use a running server instead of starting one.')
+    parser.add_argument('--cold', action='store_true',
+                        help='Skip the untimed warm-up session, so the first sessions include the cold start.')
+    args = parser.parse_args(argv)
+
+    genes = args.genes_file.read_text() if args.genes_file else DEFAULT_GENES
+    # The warm-up input is drawn after the sessions' so it differs from all of them
+    inputs = session_inputs(genes, args.users + 1)
+    warmup_input, inputs = inputs[-1:], inputs[:-1]
+
+    server, url = (None, args.url) if args.url else start_server()
+    try:
+        _wait_healthy(url, server, args.timeout)
+        if not args.cold:
+            results = asyncio.run(run_sessions(url, args.app, warmup_input, args.timeout))
+            if isinstance(results[0], BaseException):
+                print(f'warm-up session failed: {results[0]!r}')
+                return 1
+
+        start = time.perf_counter()
+        results = asyncio.run(run_sessions(url, args.app, inputs, args.timeout))
+        total = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = [r for r in results if not isinstance(r, BaseException)]
+    failures = [r for r in results if isinstance(r, BaseException)]
+    print(f'app: {args.app}  users: {args.users}  wall: {total:.2f}s  '
+          f'workers: {os.environ.get("BIO_WEBUI_COMPUTE_WORKERS", "default")}')
+    if latencies:
+        print(f'latency mean: {statistics.mean(latencies):.2f}s  '
+              f'median: {statistics.median(latencies):.2f}s  '
+              f'max: {max(latencies):.2f}s')
+    if failures:
+        print(f'{len(failures)} of {args.users} session(s) failed:')
+        for i, error in enumerate(results):
+            if isinstance(error, BaseException):
+                print(f'  session {i}: {error!r}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
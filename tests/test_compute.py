@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip('scanpy')
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from scipy import sparse  # noqa: E402
+
+from app.utils import _compute  # noqa: E402
+
+
+@pytest.fixture
+def msigdb():
+    return pd.DataFrame({
+        'geneset': ['SET_A', 'SET_A', 'SET_B'],
+        'genesymbol': ['G0', 'G1', 'G2'],
+        'collection': ['hallmark', 'hallmark', 'kegg_pathways'],
+    })
+
+
+@pytest.fixture
+def pooled_backend(msigdb):
+    backend = _compute.ComputeBackend(msigdb, n_workers=1, shm_budget=64 * 1024 ** 2)
+    yield backend
+    backend.close()
+
+
+def _expression(n_cells=60, n_genes=20, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.poisson(1.0, size=(n_cells, n_genes)).astype(np.float32)
+    # Marker genes so every group has something to rank
+    X[:20, 0] += 5
+    X[20:40, 1] += 5
+    X[40:, 2] += 5
+    obs = pd.DataFrame(
+        {'group': pd.Categorical(['a'] * 20 + ['b'] * 20 + ['c'] * 20)},
+        index=[f'cell{i}' for i in range(n_cells)])
+    var_names = pd.Index([f'G{i}' for i in range(n_genes)])
+    return X, obs, var_names
+
+
+def test_rank_genes_task_sparse_in_pool(pooled_backend):
+    X, obs, var_names = _expression()
+    X_sparse = sparse.csr_matrix(X)
+    result, _ = pooled_backend.run_on_matrix(
+        ('sparse', None), X_sparse, _compute.rank_genes_task, obs, var_names, 'group')
+    expected, _ = _compute.rank_genes_task(X_sparse.copy(), obs, var_names, 'group')
+
+    assert list(result['names'].dtype.names) == ['a', 'b', 'c']
+    for group in ('a', 'b', 'c'):
+        assert list(result['names'][group]) == list(expected['names'][group])
+    # Sparse matrices are sent with the task rather than shared
+    assert ('sparse', None) not in pooled_backend._matrices
+
+
+def test_rank_genes_task_dense_in_pool(pooled_backend):
+    X, obs, var_names = _expression()
+    result, _ = pooled_backend.run_on_matrix(
+        ('dense', None), X, _compute.rank_genes_task, obs, var_names, 'group')
+    assert result['names']['a'][0] == 'G0'
+
+
+def test_run_on_matrix_without_key(pooled_backend):
+    X, obs, var_names = _expression()
+    result, _ = pooled_backend.run_on_matrix(
+        None, X, _compute.rank_genes_task, obs, var_names, 'group')
+    assert result['names']['a'][0] == 'G0'
+    # Nothing identifies the matrix, so it is sent with the task
+    assert not pooled_backend._matrices
+
+
+def test_attach_matrix_round_trip():
+    X, _, _ = _expression()
+    for matrix in (X, sparse.csr_matrix(X), sparse.csc_matrix(X)):
+        spec, handles = _compute.publish_matrix(matrix)
+        attached_handles = []
+        try:
+            attached = _compute.attach_matrix(spec, attached_handles)
+            dense = attached.toarray() if sparse.issparse(attached) else np.array(attached)
+            # Drop the views before their shared memory is closed
+            del attached
+            np.testing.assert_array_equal(dense, X)
+        finally:
+            for shm in attached_handles + handles:
+                shm.close()
+            for shm in handles:
+                shm.unlink()
+
+
+def test_rank_genes_task_ranks_every_gene():
+    X, obs, var_names = _expression(n_genes=120)
+    ranked, _ = _compute.rank_genes_task(X, obs, var_names, 'group')
+    # GSEA (adata) needs a complete ranked list per group
+    assert len(ranked['names']) == 120
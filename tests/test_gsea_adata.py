@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip('decoupler')
+pytest.importorskip('PyComplexHeatmap')
+pytest.importorskip('pyarrow')
+import matplotlib  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+matplotlib.use('Agg')
+
+from app import gsea_adata  # noqa: E402
+from app.utils import _compute, _table  # noqa: E402
+
+N_GENES = 100
+
+
+@pytest.fixture
+def inline_backend(monkeypatch):
+    genes = [f'G{i}' for i in range(N_GENES)]
+    rows = []
+    for i in range(5):
+        rows += [(f'HALLMARK_SET_{i}', g, 'hallmark') for g in genes[i * 10:(i + 1) * 10]]
+    # Gene sets of a collection that is not selected, so the shared network
+    # holds more terms than any result
+    for i in range(5, 10):
+        rows += [(f'KEGG_SET_{i}', g, 'kegg_pathways') for g in genes[i * 10:(i + 1) * 10]]
+    msigdb = pd.DataFrame(rows, columns=['geneset', 'genesymbol', 'collection'])
+    backend = _compute.ComputeBackend(msigdb, n_workers=0)
+    monkeypatch.setattr(_compute, 'get_backend', lambda: backend)
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def group_stats():
+    rng = np.random.default_rng(0)
+    mat = pd.DataFrame(
+        rng.normal(size=(3, N_GENES)),
+        index=['a', 'b', 'c'], columns=[f'G{i}' for i in range(N_GENES)])
+    # Each group is driven by one gene set
+    for row, start in enumerate((0, 10, 20)):
+        mat.iloc[row, start:start + 10] += 4
+    return mat
+
+
+def test_run_gsea_terms_are_plain_strings(inline_backend, group_stats):
+    nes, enrich_res = gsea_adata.run_gsea(group_stats, ['hallmark'], times=100)
+
+    assert not isinstance(nes.columns, pd.CategoricalIndex)
+    assert set(nes.columns) == {f'HALLMARK_SET_{i}' for i in range(5)}
+    assert enrich_res['Term'].dtype == object
+
+    nes_matrix = nes.T.rename_axis('Term').reset_index()
+    for df in (nes_matrix, enrich_res):
+        table = _table.to_table(df)
+        assert pa.types.is_string(table.schema.field('Term').type)
+
+    # Used to fail in PyComplexHeatmap on the unused categories
+    gsea_adata.plot_results(enrich_res, threshold=1.01, top_n_terms=2)
+
+
+def test_get_group_stats_missing_stat(inline_backend):
+    import anndata as ad
+
+    rng = np.random.default_rng(1)
+    obs = pd.DataFrame({'group': pd.Categorical(['a'] * 10 + ['b'] * 10)},
+                       index=[f'cell{i}' for i in range(20)])
+    adata = ad.AnnData(X=rng.poisson(1.0, size=(20, N_GENES)).astype(np.float32), obs=obs,
+                       var=pd.DataFrame(index=[f'G{i}' for i in range(N_GENES)]))
+    ranked, _ = _compute.rank_genes_task(adata.X, obs, adata.var_names, 'group')
+    # As stored by a tool that does not record log fold changes
+    ranked.pop('logfoldchanges')
+    ranked['params'] = {**ranked['params'], 'use_raw': False, 'layer': None}
+    adata.uns['rank_genes_groups'] = ranked
+
+    assert gsea_adata.get_group_stats(adata, 'group', None, 'logfoldchanges', adata_path='missing_stat') is None
+    mat = gsea_adata.get_group_stats(adata, 'group', None, 'scores', adata_path='missing_stat')
+    assert mat.shape == (2, N_GENES)
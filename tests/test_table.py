@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('streamlit')
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+from app.utils import _table  # noqa: E402
+
+
+@pytest.fixture
+def table():
+    df = pd.DataFrame({
+        'Term': ['HALLMARK_HYPOXIA', 'KEGG_APOPTOSIS', 'HALLMARK_APOPTOSIS', None],
+        'p-value': [0.01, 0.5, 0.001, 0.2],
+        'Overlap': [3, 1, 5, 2],
+    })
+    return _table.to_table(df)
+
+
+def _read_export(fmt, path):
+    if fmt == 'csv.gz':
+        return pd.read_csv(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def test_search_table(table):
+    assert _table.search_table(table, 'apoptosis').column('Term').to_pylist() == [
+        'KEGG_APOPTOSIS', 'HALLMARK_APOPTOSIS']
+    assert _table.search_table(table, '').num_rows == 4
+    assert _table.search_table(table, 'missing').num_rows == 0
+
+
+def test_categorical_columns(table):
+    df = pd.DataFrame({
+        'Term': pd.Categorical(['KEGG_APOPTOSIS', 'HALLMARK_HYPOXIA', 'KEGG_P53', None],
+                               categories=['KEGG_APOPTOSIS', 'HALLMARK_HYPOXIA', 'KEGG_P53', 'UNUSED']),
+        'NES': [1.5, -2.0, 0.5, 1.0],
+    })
+    table = _table.to_table(df)
+    assert pa.types.is_string(table.schema.field('Term').type)
+    assert _table.search_table(table, 'kegg').column('Term').to_pylist() == ['KEGG_APOPTOSIS', 'KEGG_P53']
+    assert _table.sort_table(table, 'Term').column('Term').to_pylist() == [
+        'HALLMARK_HYPOXIA', 'KEGG_APOPTOSIS', 'KEGG_P53', None]
+
+
+def test_sort_table(table):
+    ascending = _table.sort_table(table, 'p-value')
+    assert ascending.column('p-value').to_pylist() == [0.001, 0.01, 0.2, 0.5]
+    descending = _table.sort_table(table, 'Overlap', descending=True)
+    assert descending.column('Overlap').to_pylist() == [5, 3, 2, 1]
+    assert _table.sort_table(table, None) is table
+
+
+@pytest.mark.parametrize('fmt', list(_table.EXPORT_FORMATS.values()))
+def test_write_export_round_trip(table, fmt, tmp_path, monkeypatch):
+    # Several batches, so the chunked writers are exercised
+    monkeypatch.setattr(_table, 'CHUNK_ROWS', 2)
+    view = _table.sort_table(_table.search_table(table, 'hallmark'), 'p-value')
+    path = tmp_path / f'export.{fmt}'
+    _table.write_export(view, fmt, str(path))
+    pd.testing.assert_frame_equal(_read_export(fmt, path), view.to_pandas())
+
+
+def test_write_export_unknown_format(table, tmp_path):
+    with pytest.raises(ValueError):
+        _table.write_export(table, 'xlsx', str(tmp_path / 'export.xlsx'))
+
+
+def test_discard_missing_export(tmp_path):
+    exports = _table._SessionExports()
+    path = tmp_path / 'export.parquet'
+    path.write_bytes(b'')
+    exports.set('table', 'parquet', None, str(path))
+    # Removed by another session's prune
+    os.remove(path)
+    exports.discard('table')
+    assert exports.get('table') is None
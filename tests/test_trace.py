@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('streamlit')
+pytest.importorskip('psutil')
+
+from app.utils import _trace  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch):
+    # Keep each test's metrics apart and write no files
+    monkeypatch.setattr(_trace, '_metrics', {})
+    monkeypatch.setattr(_trace, 'TRACE_DIR', '')
+    _trace.start_run('ORA (genes)')
+    return _trace._metrics
+
+
+def test_stage_cache_accounting(metrics):
+    with _trace.stage('perform_ora', cached=True) as record:
+        _trace.record_miss()
+    assert record['cache'] == 'miss'
+    with _trace.stage('perform_ora', cached=True) as record:
+        pass
+    assert record['cache'] == 'hit'
+    with _trace.stage('plot_results') as record:
+        # Not a cached stage, so a miss is not counted
+        _trace.record_miss()
+    assert record['cache'] is None
+
+    assert metrics[('ORA (genes)', 'perform_ora')]['runs'] == 2
+    assert metrics[('ORA (genes)', 'perform_ora')]['cache_hits'] == 1
+    assert metrics[('ORA (genes)', 'perform_ora')]['cache_misses'] == 1
+    assert metrics[('ORA (genes)', 'plot_results')]['cache_hits'] == 0
+    assert metrics[('ORA (genes)', 'plot_results')]['cache_misses'] == 0
+
+
+def test_record_miss_marks_innermost_stage():
+    with _trace.stage('outer', cached=True) as outer:
+        with _trace.stage('inner', cached=True) as inner:
+            _trace.record_miss()
+    assert inner['cache'] == 'miss'
+    assert outer['cache'] == 'hit'
+    # Outside any stage it is a no-op
+    _trace.record_miss()
+
+
+def test_prometheus_text(metrics):
+    with _trace.stage('perform_ora', cached=True, n_genes=3):
+        _trace.record_miss()
+    text = _trace._prometheus_text()
+    lines = text.splitlines()
+    assert text.endswith('\n')
+    assert '# TYPE bio_webui_stage_runs_total counter' in lines
+    assert '# TYPE bio_webui_stage_last_seconds gauge' in lines
+    assert 'bio_webui_stage_runs_total{app="ORA (genes)",stage="perform_ora"} 1' in lines
+    assert 'bio_webui_stage_cache_misses_total{app="ORA (genes)",stage="perform_ora"} 1' in lines
+    assert 'bio_webui_stage_cache_hits_total{app="ORA (genes)",stage="perform_ora"} 0' in lines
+    # One sample per metric for the single stage
+    samples = [line for line in lines if not line.startswith('#')]
+    assert len(samples) == len(_trace._PROMETHEUS_METRICS)
+
+
+def test_rotate(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    for suffix, content in [('', 'current'), ('.1', 'one'), ('.2', 'two'), ('.3', 'three')]:
+        (tmp_path / f'trace.jsonl{suffix}').write_text(content)
+    _trace._rotate(str(path))
+
+    assert not path.exists()
+    assert (tmp_path / 'trace.jsonl.1').read_text() == 'current'
+    assert (tmp_path / 'trace.jsonl.2').read_text() == 'one'
+    assert (tmp_path / 'trace.jsonl.3').read_text() == 'two'
+    # Only TRACE_BACKUPS old files are kept
+    assert not (tmp_path / f'trace.jsonl.{_trace.TRACE_BACKUPS + 1}').exists()
+
+
+def test_rotate_first_time(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    path.write_text('current')
+    _trace._rotate(str(path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['trace.jsonl.1']
@@ -1,14 +1,32 @@
 import streamlit as st
+from app.utils import _startup, _trace
 
 
 def setup_ui():
     st.set_page_config(page_title="Bio WebUI", page_icon="🤔")
 
 
+def show_startup_report(report):
+    with st.expander('Startup report'):
+        if not report.done.is_set():
+            st.caption('Warming up in the background...')
+        st.dataframe(report.to_df(), hide_index=True)
+
+
+def show_diagnostics():
+    with st.expander('Diagnostics'):
+        st.caption('Stages of the latest run')
+        st.dataframe(_trace.session_df(), hide_index=True)
+        st.caption('All sessions since startup')
+        st.dataframe(_trace.process_df(), hide_index=True)
+        st.download_button('Prometheus metrics', _trace.prometheus_text(), file_name='metrics.prom')
+
+
 def main():
+    report = _startup.start_prewarm()
     with st.sidebar:
         st.header("Bio WebUI")
-        api_options = ('ORA (genes)', 'GSEA (genes)', 'Survival', 'ORA (adata)')
+        api_options = ('ORA (genes)', 'GSEA (genes)', 'Survival', 'ORA (adata)', 'GSEA (adata)')
         app_choice = st.selectbox(
             label="Choose an app to run", 
             index=None,
@@ -42,10 +60,25 @@ def main():
             from app import ora_adata
             run = ora_adata.main
             title = "ORA Analysis (AnnData)"
+
+        elif app_choice == "GSEA (adata)":
+            st.caption(
+                "Gene Set Enrichment Analysis (AnnData)")
+            from app import gsea_adata
+            run = gsea_adata.main
+            title = "GSEA Analysis (AnnData)"
+
+        show_startup_report(report)
     
-    if app_choice is not None:
-        st.title(title)
-        run()
+    _trace.start_run(app_choice)
+    try:
+        if app_choice is not None:
+            st.title(title)
+            run()
+    finally:
+        # Also after an app failed, when its stage timings matter most
+        with st.sidebar:
+            show_diagnostics()
             
             
 if __name__ == "__main__":